@@ -2,6 +2,10 @@
 
 from src.simulation import *
 from src.compute_directions import *
+from src.pipeline import CommandStreamer
+from src.checkpoint import Checkpointer, load_checkpoint
+import os
+import queue
 import sys
 import time
 
@@ -33,25 +37,49 @@ if __name__ == "__main__":
         window_size = [1200, 800]
         baudRate = 9600
 
+    frame_rate = 30
+    machine_lookahead = 50 #how many pegs the solver can get ahead of the machine
+    checkpoint_every = 10 #pegs the machine finishes between checkpoints, 0 to turn them off
+    #one checkpoint per image and settings, restore_solver_state checks them too
+    settings = "{}_{}_{}_{}".format(peg_num, string_thickness, real_radius, max_overlap).replace(".", "")
+    checkpoint_file = file_name.split(".")[0] + "_{}_checkpoint.npz".format(settings)
     arduinoComPort = "COM7"
     pygame.init()
 
-    stringomatic = System(window_size, peg_num = peg_num, string_thickness = string_thickness)
+    stringomatic = System(window_size, peg_num = peg_num, string_thickness = string_thickness, dirty_rects = True)
     image = ImageProcessor(file_name, peg_num = peg_num, string_thickness = string_thickness,
-                            real_radius = real_radius, max_overlap = max_overlap)
+                            real_radius = real_radius, max_overlap = max_overlap, engine = "numpy")
     stringomatic.add_image_information(image)
 
-    half_step = 180/peg_num
-    current_location = [0,0] #r, theta (degrees)
-    peg_locations = list([360/peg_num* i for i in range(peg_num)])
+    #pick up where the last run stopped if it left a checkpoint
+    peg_list, current_location, acknowledged = None, None, 0
+    if checkpoint_every and os.path.exists(checkpoint_file):
+        peg_list, current_location, acknowledged = load_checkpoint(checkpoint_file, image)
+        print("Resuming from {}: {} pegs solved, {} done by the machine".format(checkpoint_file, len(peg_list) - 1, acknowledged))
+        stringomatic.draw_mesh(peg_list)
 
     # Set up serial port and send initialization message
     serial_port = serial.Serial(arduinoComPort, baudRate, timeout=1)
-    msg_send = "Initializing"
+    msg_send = "Initializing\n" #newline terminated like every other command, see Stepper_Control.ino
     msg_send = msg_send.encode() #'utf-8'
     serial_port.write(msg_send)
     time.sleep(1)
 
+    #the solver runs ahead in the background, the streamer sends commands as the machine finishes them
+    #and the display draws whatever was solved once per frame
+    peg_queue = queue.Queue()
+    machine_queue = queue.Queue(maxsize = machine_lookahead)
+    solver = SolverThread(image, peg_queue, max_string = max_string, machine_queue = machine_queue, peg_list = peg_list)
+    checkpointer = Checkpointer(checkpoint_file, solver, every = checkpoint_every) if checkpoint_every else None
+    streamer = CommandStreamer(serial_port, machine_queue, peg_num, real_radius, current_location = current_location,
+                                acknowledged = acknowledged, checkpointer = checkpointer)
+    streamer.start()
+    if peg_list is not None:
+        for peg in peg_list[acknowledged + 1:]: #solved before the crash but never finished by the machine
+            machine_queue.put((peg, image.total_string_cost))
+    solver.start()
+    clock = pygame.time.Clock()
+
     check = True #checks if string art is complete
     done = False #checks if pygame window should be open
     while not done:
@@ -65,18 +93,15 @@ if __name__ == "__main__":
                     done = True
                 elif event.key == pygame.K_SPACE:
                     check = not check
-
-        if image.total_string_cost < max_string and check:
-            check, next_peg = stringomatic.draw_mesh_live(image)
-            if check:
-                peg_loc = peg_locations[next_peg]
-                current_location, commands = loop_around_peg(current_location, peg_loc, half_step, real_radius)
-                for command in commands:
-                    print("Sent: {}".format(command))
-                    send_command_and_receive_response(command, serial_port)
-
-
-
-
-        else:
-            sleep(.1)
+                    if check:
+                        solver.resume()
+                    else:
+                        solver.pause()
+
+        stringomatic.draw_queued_lines(peg_queue)
+        if streamer.error is not None:
+            print("Lost the machine: {}".format(streamer.error))
+            done = True
+        clock.tick(frame_rate)
+
+    solver.stop()
@@ -6,6 +6,8 @@ import sys
 import time
 import serial
 
+from src.framing import negotiate_batch_size, send_frame_and_receive_response, split_into_batches
+
 def send_list_and_receive_response(peg_list, serial_port):
     """
     send_list_and_receive_response converts a peg_list of tuples into a string
@@ -66,27 +68,26 @@ arduinoComPort = "COM6"
 # Set up serial port and send initialization message
 print("Sending Initialization Message")
 serial_port = serial.Serial(arduinoComPort, baudRate, timeout=1)
-msg_send = "Initializing"
+msg_send = "Initializing\n" #newline terminated like every other command, see Stepper_Control.ino
 msg_send = msg_send.encode()
 serial_port.write(msg_send)
 time.sleep(1)
 
-# Break up peg_list into sublists of <= 20 elements
+# Ask the Arduino how many tuples fit in one message (20 for sketches that don't say)
+serial_port.reset_input_buffer()
+batch_size = negotiate_batch_size(serial_port)
+
+# Break up peg_list into sublists of <= batch_size elements and send each one as a binary frame
 peg_list = peg_list_card
-num_msgs = int(len(peg_list)/20)
-print("Number of peg lists", num_msgs)
+batches = split_into_batches(peg_list, batch_size)
+print("Batch size", batch_size)
+print("Number of peg lists", len(batches))
 print("Length of peg list", len(peg_list))
-index = 0
-while num_msgs > 0:
-    send_list_and_receive_response(peg_list[index:index+20], serial_port)
-    index = index + 20
-    num_msgs = num_msgs - 1
-# Don't forget to send the leftover tuples
-if index < len(peg_list):
-    send_list_and_receive_response(peg_list[index:], serial_port)
+for batch in batches:
+    send_frame_and_receive_response(batch, serial_port)
 
 # Send "Finished message"
 print("Sending Finished Message")
-msg_send = "Finished"
+msg_send = "Finished\n"
 msg_send = msg_send.encode()
 serial_port.write(msg_send)
@@ -0,0 +1,134 @@
+# batch runs many headless string art jobs in parallel, one image and settings
+# combination per process, e.g. all the logos in a folder at 90 pegs / .75 ft.
+#
+# Run from the Image Processing folder:
+#   python -m src.batch logos/ -o batch_results --pegs 90 --radius .75
+#   python -m src.batch manifest.json -o batch_results --workers 4
+#
+# A manifest is either a list of jobs:
+#   [{"file_name": "adidas.jpeg", "peg_num": 90, "real_radius": .75}, ...]
+# or images and settings that get combined with each other:
+#   {"images": ["adidas.jpeg", "nike.jpeg"], "settings": [{"peg_num": 90}, {"peg_num": 200}]}
+
+import argparse
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.headless import run_job, default_output_dir
+
+IMAGE_EXTENSIONS = (".jpeg", ".jpg", ".png", ".bmp", ".gif")
+
+
+def find_images(directory):
+    """Lists the image files in a directory"""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                    if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def load_jobs(source, settings = None):
+    """
+    Creates the list of job dictionaries for a batch.
+
+    source -- folder of images or path to a JSON manifest
+    settings -- list of setting dictionaries used for a folder (default: one job per image with default settings)
+    """
+    if os.path.isdir(source):
+        images = find_images(source)
+    else:
+        with open(source) as f:
+            manifest = json.load(f)
+        base_dir = os.path.dirname(os.path.abspath(source))
+        if isinstance(manifest, list):
+            return [dict(job, file_name = os.path.join(base_dir, job["file_name"])) for job in manifest]
+        images = [os.path.join(base_dir, image) for image in manifest["images"]]
+        settings = manifest.get("settings", settings)
+
+    settings = settings or [{}]
+    return [dict(setting, file_name = image) for image in images for setting in settings]
+
+
+def job_output_dirs(jobs, output_root):
+    """Gives every job its own output folder, numbering jobs that would otherwise share a name"""
+    names = [default_output_dir(job["file_name"], job.get("peg_num", 36), job.get("real_radius", .75)) for job in jobs]
+    return [os.path.join(output_root, name if names.count(name) == 1 else "{}_{}".format(name, index))
+            for index, name in enumerate(names)]
+
+
+def run_job_safely(job, output_dir):
+    """Runs one job in a worker process. Errors are returned instead of raised so one bad image doesn't stop the batch."""
+    job = dict(job)
+    file_name = os.path.abspath(job.pop("file_name"))
+    result = dict(file_name = file_name, output_dir = output_dir, settings = job)
+    start = time.time()
+    try:
+        result["summary"] = run_job(file_name, output_dir = output_dir, **job)
+        result["status"] = "ok"
+    except Exception as error:
+        result["status"] = "failed"
+        result["error"] = "{}: {}".format(type(error).__name__, error)
+        result["traceback"] = traceback.format_exc()
+    result["wall_time"] = time.time() - start
+    return result
+
+
+def run_batch(jobs, output_root, workers = None):
+    """
+    Fans jobs out across a process pool and writes batch_summary.json to output_root.
+
+    jobs -- list of dictionaries with a file_name and any run_job settings
+    workers -- number of processes (default: number of CPU cores)
+
+    Returns the list of job results in the same order as jobs.
+    """
+    os.makedirs(output_root, exist_ok = True)
+    start = time.time()
+    results = [None]*len(jobs)
+    output_dirs = job_output_dirs(jobs, output_root)
+
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        futures = {pool.submit(run_job_safely, job, output_dirs[index]): index for index, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as error: #the worker process itself died
+                results[index] = dict(file_name = jobs[index].get("file_name"), settings = jobs[index],
+                                    status = "failed", error = "{}: {}".format(type(error).__name__, error))
+            print("[{}] {} {}".format(results[index]["status"], results[index]["file_name"],
+                                    results[index].get("error", "")))
+
+    with open(os.path.join(output_root, "batch_summary.json"), "w") as f:
+        json.dump(dict(wall_time = time.time() - start, jobs = results), f, indent = 4)
+    return results
+
+
+def parse_args(args = None):
+    parser = argparse.ArgumentParser(description = "Compute string art peg lists for many images in parallel.")
+    parser.add_argument("source", help = "folder of images or JSON manifest")
+    parser.add_argument("-o", "--output-root", default = "batch_results", help = "folder for the job result folders")
+    parser.add_argument("--workers", type = int, default = None, help = "number of processes (default: CPU cores)")
+    parser.add_argument("--pegs", type = int, nargs = "+", default = None, help = "peg numbers to run every image with")
+    parser.add_argument("--radius", type = float, default = None, help = "board radius in feet")
+    parser.add_argument("--max-string", type = float, default = None, help = "spool length in feet")
+    parser.add_argument("--cache-dir", default = None, help = "folder to cache preprocessed images and lines in")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    common = {}
+    if args.radius is not None:
+        common["real_radius"] = args.radius
+    if args.max_string is not None:
+        common["max_string"] = args.max_string
+    if args.cache_dir is not None:
+        common["cache_dir"] = args.cache_dir
+    settings = [dict(common, peg_num = pegs) for pegs in args.pegs] if args.pegs else [common]
+
+    jobs = load_jobs(args.source, settings)
+    results = run_batch(jobs, args.output_root, workers = args.workers)
+    failed = [result for result in results if result["status"] != "ok"]
+    print("{} jobs done, {} failed".format(len(results), len(failed)))
@@ -0,0 +1,217 @@
+# benchmark times every stage of the string art pipeline across peg counts and
+# saves the results as JSON, so a change to the solver can be checked against a
+# saved baseline for regressions. With no image arguments it runs on the sample
+# photos the repo already ships with the website (leon.jpg and woman.jpeg); the
+# generated test pattern is only used when those are missing, and it says so.
+# benchmark_baseline.json in this folder is a saved run over the sample photos.
+#
+# Run from the Image Processing folder:
+#   python -m src.benchmark -o benchmark.json
+#   python -m src.benchmark --baseline benchmark_baseline.json   (compare against a saved run)
+#   python -m src.benchmark -o benchmark_baseline.json           (save a new baseline)
+#   python -m src.benchmark --pegs 200 --pyramid 150 300          (pyramid mode against full resolution)
+#   python -m src.benchmark --pegs 1000 --engine lowmem            (memory-mapped line index, see peak_rss)
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from src.headless import peak_rss
+from src.preprocess import preprocess
+from src.simulation import ImageProcessor
+
+PEG_COUNTS = [48, 90, 200, 400]
+SRC_DIR = os.path.dirname(os.path.realpath(__file__))
+REPO_DIR = os.path.dirname(os.path.dirname(SRC_DIR))
+#relative to the repo root
+SAMPLE_IMAGES = [os.path.join("Website", "Website Files", "assets", "images", "leon.jpg"),
+                 os.path.join("Website", "Website Files", "sprint_images", "sprint2", "woman.jpeg")]
+
+
+def find_sample_images(names = SAMPLE_IMAGES):
+    """Returns the paths of the sample images that are in the repo"""
+    return [os.path.join(REPO_DIR, name) for name in names if os.path.isfile(os.path.join(REPO_DIR, name))]
+
+
+def make_test_image(size = 600):
+    """Draws a pokeball-like test pattern for when none of the sample images are around"""
+    image = Image.new('RGB', (size, size), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((size//8, size//8, size*7//8, size*7//8), fill = (220, 30, 30))
+    draw.rectangle((size//8, size*15//32, size*7//8, size*17//32), fill = (0, 0, 0))
+    draw.ellipse((size*13//32, size*13//32, size*19//32, size*19//32), fill = (255, 255, 255), outline = (0, 0, 0), width = size//50)
+    path = os.path.join(tempfile.mkdtemp(), "test_pattern.png")
+    image.save(path)
+    return path
+
+
+def time_calls(function, repeats):
+    """Returns the mean time of a function call in seconds"""
+    start = time.perf_counter()
+    for i in range(repeats):
+        function()
+    return (time.perf_counter() - start)/repeats
+
+
+def benchmark_image(path, peg_num, steps = 100, max_lines = 1000, engine = "numpy"):
+    """Times preprocessing, line precompute, one solver step and a full run for one image and peg count."""
+    image = ImageProcessor(path, peg_num = peg_num, max_lines = max_lines, engine = engine, show_original = False)
+    #timed on their own, setup minus the line index time is too noisy for the few milliseconds preprocessing takes
+    preprocess_time = time_calls(lambda: preprocess(path), 3)
+    line_time = time_calls(image.open_row_index if engine == "lowmem" else image.build_line_index, 1)
+
+    #per step costs, measured on the first steps of a run
+    best_path_time = draw_line_time = error_time = 0
+    timed_steps = 0
+    for step in range(steps):
+        t_0 = time.perf_counter()
+        best_peg = image.compute_best_path()
+        t_1 = time.perf_counter()
+        if best_peg == image.current_index:
+            break
+        image.draw_line(best_peg)
+        t_2 = time.perf_counter()
+        image.mean_squared_error()
+        t_3 = time.perf_counter()
+        best_path_time += t_1 - t_0
+        draw_line_time += t_2 - t_1
+        error_time += t_3 - t_2
+        timed_steps += 1
+    timed_steps = max(timed_steps, 1)
+
+    image.reset()
+    start = time.perf_counter()
+    peg_list = image.find_peg_list()
+    run_time = time.perf_counter() - start
+
+    return dict(
+        image = os.path.basename(path),
+        diameter = image.diameter,
+        peg_num = peg_num,
+        engine = engine,
+        preprocess_time = preprocess_time,
+        compute_lines_time = line_time,
+        line_index_bytes = int(image.line_index_bytes()),
+        compute_best_path_time = best_path_time/timed_steps,
+        draw_line_time = draw_line_time/timed_steps,
+        mean_squared_error_time = error_time/timed_steps,
+        full_run_time = run_time,
+        full_run_lines = len(peg_list) - 1,
+        peak_rss = peak_rss(), #of the whole process so far, benchmark one engine and peg count per run to compare
+        )
+
+
+def run_benchmarks(paths, peg_counts = PEG_COUNTS, steps = 100, max_lines = 1000, engine = "numpy"):
+    results = []
+    for path in paths:
+        for peg_num in peg_counts:
+            result = benchmark_image(path, peg_num, steps, max_lines, engine)
+            print("{image} {peg_num} pegs: lines {compute_lines_time:.3f}s, step {compute_best_path_time:.5f}s, "
+                  "run {full_run_time:.2f}s".format(**result))
+            results.append(result)
+    return dict(
+        python = platform.python_version(),
+        numpy = np.__version__,
+        machine = platform.machine(),
+        processor = platform.processor(),
+        results = results,
+        )
+
+
+def compare_to_baseline(report, baseline, tolerance = .2, min_slowdown = 1e-3):
+    """Returns a list of (image, peg_num, metric, baseline, new) for every timing that got slower than tolerance allows.
+    Slowdowns under min_slowdown seconds are timer noise on the per step costs and are not counted."""
+    old_results = {(result["image"], result["peg_num"], result["engine"]): result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old = old_results.get((result["image"], result["peg_num"], result["engine"]))
+        if old is None:
+            continue
+        for metric, value in result.items():
+            if (metric.endswith("_time") and metric in old and value > old[metric]*(1 + tolerance)
+                    and value - old[metric] > min_slowdown):
+                regressions.append((result["image"], result["peg_num"], metric, old[metric], value))
+    return regressions
+
+
+def pyramid_report(path, peg_num, pyramid_sizes, refine_top = 8, max_lines = 1000):
+    """Runs an image at full resolution and in pyramid mode at each pyramid size.
+    Returns a result per run with its times, line index size, final error and quality_loss,
+    the error increase over the full resolution run as a fraction."""
+    results = []
+    for pyramid_size in [None] + list(pyramid_sizes):
+        start = time.perf_counter()
+        image = ImageProcessor(path, peg_num = peg_num, max_lines = max_lines, engine = "numpy", show_original = False,
+                                pyramid_size = pyramid_size, refine_top = refine_top)
+        setup_time = time.perf_counter() - start
+        start = time.perf_counter()
+        peg_list = image.find_peg_list()
+        results.append(dict(
+            image = os.path.basename(path),
+            diameter = image.diameter,
+            peg_num = peg_num,
+            pyramid_size = pyramid_size,
+            refine_top = refine_top,
+            setup_time = setup_time,
+            solve_time = time.perf_counter() - start,
+            line_index_bytes = int(image.line_index_bytes()),
+            lines = len(peg_list) - 1,
+            mse = image.image_error(),
+            ))
+    for result in results:
+        result["quality_loss"] = result["mse"]/results[0]["mse"] - 1
+    return results
+
+
+def parse_args(args = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the string art pipeline.")
+    parser.add_argument("images", nargs = "*", help = "images to benchmark (default: the sample photos in Website/)")
+    parser.add_argument("--pegs", type = int, nargs = "+", default = PEG_COUNTS, help = "peg counts")
+    parser.add_argument("--steps", type = int, default = 100, help = "solver steps to time per step costs on")
+    parser.add_argument("--max-lines", type = int, default = 1000, help = "lines in the full run")
+    parser.add_argument("--engine", choices = ["numpy", "pil", "lowmem"], default = "numpy", help = "residual image engine")
+    parser.add_argument("-o", "--output", default = "benchmark.json", help = "JSON file to save the results to")
+    parser.add_argument("--baseline", help = "JSON results of an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type = float, default = .2, help = "allowed slowdown against the baseline")
+    parser.add_argument("--pyramid", type = int, nargs = "+", help = "compare pyramid mode at these coarse sizes instead")
+    parser.add_argument("--refine-top", type = int, default = 8, help = "lines refined at full resolution in pyramid mode")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    paths = [os.path.abspath(path) for path in args.images] or find_sample_images()
+    if not paths:
+        #the pattern is not a photo, so its times are not comparable with benchmark_baseline.json
+        print("No sample images found in Website/, benchmarking a generated test pattern instead")
+        paths = [make_test_image()]
+
+    if args.pyramid:
+        results = [result for path in paths for peg_num in args.pegs
+                   for result in pyramid_report(path, peg_num, args.pyramid, args.refine_top, args.max_lines)]
+        print("image  pegs  pyramid  setup    solve   index MB      mse  quality loss")
+        for result in results:
+            print("{image}  {peg_num}  {pyramid_size!s:>7}  {setup_time:5.2f}s  {solve_time:6.2f}s  {index_mb:8.1f}  {mse:7.1f}  {quality_loss:+.2%}".format(
+                index_mb = result["line_index_bytes"]/1e6, **result))
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 4)
+        raise SystemExit(0)
+
+    report = run_benchmarks(paths, args.pegs, args.steps, args.max_lines, args.engine)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent = 4)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        for image, peg_num, metric, old, new in regressions:
+            print("REGRESSION {} {} pegs {}: {:.4f}s -> {:.4f}s".format(image, peg_num, metric, old, new))
+        if regressions:
+            raise SystemExit(1)
+        print("No regressions against", args.baseline)
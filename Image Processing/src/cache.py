@@ -0,0 +1,130 @@
+# cache keeps preprocessed images and line pixel indexes on disk as .npy files,
+# so repeat runs and sweeps of the same image skip the PIL preprocessing and
+# compute_lines. Files are loaded memory-mapped and the cache is kept under a
+# size limit by deleting the least recently used entries. The row-major line
+# index of the lowmem engine is kept as a raw file in its own entry, see
+# ImageProcessor.build_row_index.
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "stringomatic")
+
+
+def file_hash(path):
+    """Returns the sha1 hex digest of a file's content"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ImageCache:
+    """Stores preprocessed images and line indexes as memory-mappable .npy files in cache_dir."""
+
+    def __init__(self, cache_dir = DEFAULT_CACHE_DIR, max_bytes = 2*1024**3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok = True)
+
+    def image_key(self, path, diameter, contrast = 0, edges = 0):
+        key = "image_{}_{}".format(file_hash(path), diameter)
+        return key if not (contrast or edges) else key + "_{}_{}".format(contrast, edges)
+
+    def lines_key(self, diameter, peg_num, string_thickness, line_model = "legacy"):
+        #lines only depend on the image size, so every image with the same diameter shares them
+        key = "lines_{}_{}_{}".format(diameter, peg_num, string_thickness)
+        return key if line_model == "legacy" else key + "_" + line_model
+
+    def load(self, key, names):
+        """Returns the memory-mapped arrays of an entry, or None if it isn't cached"""
+        entry = os.path.join(self.cache_dir, key)
+        try:
+            arrays = [np.load(os.path.join(entry, name + ".npy"), mmap_mode = "r") for name in names]
+        except (FileNotFoundError, ValueError):
+            return None
+        os.utime(entry) #mark as recently used for eviction
+        return arrays
+
+    def save(self, key, arrays):
+        """Writes a dictionary of arrays as one entry, then evicts old entries if the cache is too big"""
+        def write(folder):
+            for name, array in arrays.items():
+                np.save(os.path.join(folder, name + ".npy"), array)
+        self.save_files(key, write)
+
+    def save_files(self, key, write):
+        """Makes an entry of the files write(folder) puts in a folder, then evicts old entries if the cache is too big"""
+        entry = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry):
+            return
+        #write to a temporary folder first so other processes never see half written entries
+        temp_entry = tempfile.mkdtemp(dir = self.cache_dir, prefix = ".tmp_")
+        try:
+            write(temp_entry)
+        except BaseException:
+            shutil.rmtree(temp_entry, ignore_errors = True)
+            raise
+        try:
+            os.rename(temp_entry, entry)
+        except OSError: #another process saved the same entry first
+            shutil.rmtree(temp_entry, ignore_errors = True)
+        self.evict()
+
+    def entry_path(self, key):
+        """Returns the folder of an entry to read its files directly, or None if it isn't cached"""
+        entry = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry):
+            return None
+        os.utime(entry) #mark as recently used for eviction
+        return entry
+
+    def entry_size(self, entry):
+        return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache is under max_bytes"""
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, key)
+            if key.startswith(".") or not os.path.isdir(entry):
+                continue
+            try:
+                entries.append((os.path.getmtime(entry), self.entry_size(entry), entry))
+            except OSError: #evicted by another process
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors = True)
+            total -= size
+
+    def load_image(self, path, diameter, contrast = 0, edges = 0):
+        """Returns the preprocessed (cropped, grayscale, inverted, circle masked) image array or None"""
+        arrays = self.load(self.image_key(path, diameter, contrast, edges), ["image"])
+        return arrays[0] if arrays is not None else None
+
+    def save_image(self, path, diameter, image, contrast = 0, edges = 0):
+        self.save(self.image_key(path, diameter, contrast, edges), dict(image = np.asarray(image, dtype = np.uint8)))
+
+    def load_lines(self, diameter, peg_num, string_thickness, line_model = "legacy"):
+        """Returns (line_offsets, line_pixels, line_lengths) or None, with line_weights at the end for weighted line models"""
+        names = ["offsets", "pixels", "lengths"] if line_model == "legacy" else ["offsets", "pixels", "lengths", "weights"]
+        return self.load(self.lines_key(diameter, peg_num, string_thickness, line_model), names)
+
+    def save_lines(self, diameter, peg_num, string_thickness, line_offsets, line_pixels, line_lengths, line_weights = None,
+                   line_model = "legacy"):
+        arrays = dict(offsets = line_offsets, pixels = line_pixels, lengths = line_lengths)
+        if line_weights is not None:
+            arrays["weights"] = line_weights
+        self.save(self.lines_key(diameter, peg_num, string_thickness, line_model), arrays)
+
+    def row_lines_key(self, diameter, peg_num):
+        return "rows_{}_{}".format(diameter, peg_num)
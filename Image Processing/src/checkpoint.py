@@ -0,0 +1,95 @@
+# checkpoint saves a live run to disk so a crash or a lost serial link doesn't
+# throw away a multi-hour build. A checkpoint holds the solver state of the
+# ImageProcessor (residual, histogram, previous_pegs, ...), every peg solved so
+# far, the machine position and how many pegs the machine has acknowledged.
+#
+# The solver usually runs ahead of the machine, so resuming restores the solver
+# where it was and sends the solved pegs the machine never finished again,
+# starting right after the last acknowledged one. Nothing is solved twice.
+# The checkpoint is removed once the machine finishes the whole job.
+#
+# Example (see main.py):
+#   checkpointer = Checkpointer("pokeball_checkpoint.npz", solver, every = 10)
+#   streamer = CommandStreamer(serial_port, machine_queue, peg_num, real_radius, checkpointer = checkpointer)
+
+import os
+import tempfile
+
+import numpy as np
+
+
+def compact_array(array):
+    """Stores integer valued images as uint8, which is what they are unless the image was scaled"""
+    array = np.asarray(array)
+    if array.dtype != np.uint8 and array.ndim == 2:
+        small = np.clip(array, 0, 255).astype(np.uint8)
+        if np.array_equal(small, array):
+            return small
+    return array
+
+
+def save_checkpoint(file_name, image, peg_list, current_location = None, acknowledged = 0):
+    """
+    Saves the state of an ImageProcessor run to a compressed .npz file.
+
+    peg_list -- every peg solved so far, starting with the first peg
+    current_location -- [r, theta] of the machine after the last acknowledged peg
+    acknowledged -- how many pegs after the first one the machine has finished
+    """
+    state = image.solver_state()
+    state["residual"] = compact_array(state["residual"])
+    state["comparison"] = compact_array(state["comparison"])
+    state["peg_list"] = np.array(peg_list)
+    state["current_location"] = np.array(current_location if current_location is not None else [0, 0], dtype=np.float64)
+    state["acknowledged"] = acknowledged
+
+    #write next to the old checkpoint and swap, so a crash while saving keeps the old one
+    folder = os.path.dirname(os.path.abspath(file_name))
+    handle, temp_name = tempfile.mkstemp(dir = folder, prefix = ".tmp_", suffix = ".npz")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            np.savez_compressed(f, **state)
+        os.replace(temp_name, file_name)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+
+
+def load_checkpoint(file_name, image):
+    """
+    Restores an ImageProcessor from a checkpoint made on the same image and settings.
+    Returns (peg_list, current_location, acknowledged).
+    """
+    with np.load(file_name) as state:
+        state = dict(state)
+    image.restore_solver_state(state)
+    return ([int(peg) for peg in state["peg_list"]],
+            [float(value) for value in state["current_location"]],
+            int(state["acknowledged"]))
+
+
+class Checkpointer:
+    """Saves checkpoints of a SolverThread's run for a CommandStreamer every few acknowledged pegs"""
+
+    def __init__(self, file_name, solver, every = 10):
+        self.file_name = file_name
+        self.solver = solver
+        self.every = every
+
+    def save(self, streamer):
+        with self.solver.lock:
+            save_checkpoint(self.file_name, self.solver.image, self.solver.peg_list,
+                            streamer.current_location, streamer.acknowledged)
+
+    def finish(self, streamer):
+        """Called by the streamer once the machine finished every peg. Removes the checkpoint so the next run
+        starts over, unless the solver was stopped before it was done."""
+        if self.solver.stopped:
+            self.save(streamer)
+        elif os.path.exists(self.file_name):
+            os.remove(self.file_name)
+
+    def acknowledged(self, streamer):
+        """Called by the streamer after every acknowledged peg"""
+        if self.every and streamer.acknowledged % self.every == 0:
+            self.save(streamer)
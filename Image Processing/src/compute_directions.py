@@ -92,41 +92,119 @@ def loop_around_peg(current_location, peg_location, half_step, r, peg_location2)
 
 
 
+COMMAND_DTYPE = np.dtype([("dr", np.float64), ("dtheta", np.float64), ("direction", "U1"), ("dtheta2", np.float64)])
+
+
+def compile_peg_list(peg_num, peg_list, real_board_radius, current_location = None):
+    """
+    Compiles a whole peg list into a motion program in one pass, giving the same
+    commands as calling loop_around_peg for every peg.
+    The first peg is where the machine starts, every other peg gets one command that
+    wraps towards the peg after it (the last peg doesn't wrap).
+    Receives: peg_num, peg_list, real_board_radius, current_location ([r, theta], [0,0] by default)
+    Returns: new current_location and a COMMAND_DTYPE array of (dr, dtheta, direction, dtheta2)
+    """
+    half_step = 180/peg_num
+    peg_loc = [360/peg_num* i for i in range(peg_num)]
+    r_current, theta_current = current_location if current_location is not None else (0, 0)
+    r_in = real_board_radius*.90
+
+    pegs = peg_list[1:]
+    dr_list = [0.]*len(pegs)
+    dtheta_list = [0.]*len(pegs)
+    direction_list = [""]*len(pegs)
+    dtheta2_list = [0.]*len(pegs)
+    for index, peg in enumerate(pegs):
+        peg_location = peg_loc[peg]
+        peg_location2 = peg_loc[pegs[index + 1]] if index + 1 < len(pegs) else peg_location
+        target_0 = peg_location - half_step
+        target_1 = target_0 - 360
+
+        #same decisions as loop_around_peg, with plain floats instead of lists
+        loc_B0 = theta_current%360
+        loc_B180 = (loc_B0 + 180)%360
+        diff_0, diff_1 = abs(target_0 - loc_B0), abs(target_1 - loc_B0)
+        if min(diff_0, diff_1) <= min(abs(target_0 - loc_B180), abs(target_1 - loc_B180)):
+            direction = "N"
+            dtheta = (target_0 if diff_0 <= diff_1 else target_1) - loc_B0
+            dr_in = r_in - r_current
+        else:
+            direction = "S"
+            dtheta = (target_0 if abs(target_0 - loc_B180) <= abs(target_1 - loc_B180) else target_1) - loc_B180
+            dr_in = -r_in - r_current
+            peg_location2 = peg_location2 + 180
+
+        r_current = r_current + dr_in
+        theta_current = ((theta_current + dtheta)%360 + 2*half_step)%360
+
+        if peg_location == peg_location2:
+            dtheta2 = 0
+        else:
+            diff1 = peg_location2 - theta_current
+            diff2 = (360 - abs(diff1)) * (-1 if diff1 > 0 else 1 if diff1 < 0 else 0)
+            dtheta2 = diff1 if abs(diff1) <= abs(diff2) else diff2
+            dtheta2 = dtheta2 - half_step if dtheta2 < 0 else dtheta2 + half_step
+        theta_current = (theta_current + dtheta2)%360
+
+        dr_list[index] = dr_in
+        dtheta_list[index] = dtheta
+        direction_list[index] = direction
+        dtheta2_list[index] = dtheta2
+
+    program = np.empty(len(pegs), COMMAND_DTYPE)
+    program["dr"] = dr_list
+    program["dtheta"] = dtheta_list
+    program["direction"] = direction_list
+    program["dtheta2"] = dtheta2_list
+    return [r_current, theta_current], program
+
+
+def program_commands(program):
+    """Turns a compiled program back into [dr, dtheta, direction, dtheta2] commands for sending or replaying"""
+    return [[float(dr), float(dtheta), str(direction), float(dtheta2)] for dr, dtheta, direction, dtheta2 in program.tolist()]
+
+
+def save_program(file_name, program):
+    np.save(file_name, program)
+
+
+def load_program(file_name):
+    return np.load(file_name)
+
+
 def process_peg_list(peg_num, peg_list, real_board_radius):
     """
     Receives: peg_list
     Returns: d_theta and d_r per time step
     """
-    half_step = 180/peg_num
-    current_location = [0,0] #r, theta (degrees)
-    peg_loc = list([360/peg_num* i for i in range(peg_num)])
-    command_list = []
+    current_location, program = compile_peg_list(peg_num, peg_list, real_board_radius)
+    return program_commands(program)
 
-    for i in peg_list[1:]:
-        peg_location = peg_loc[i]
-        current_location, commands = loop_around_peg(current_location, peg_location, half_step, real_board_radius)
-        command_list = command_list + commands
-        print("Commands: {}\nCurrent Location: {}".format(commands, current_location))
-    return command_list
+
+def command_message(command):
+    """Formats a [dr, dtheta, direction, dtheta2] command as the "radius,theta,direction,theta2" message"""
+    radius = str(command[0])
+    theta = str(command[1])
+    direction = str(command[2])
+    theta2 = str(command[3])
+    return radius + "," + theta + "," + direction + "," + theta2
 
 
-def send_command_and_receive_response(command, serial_port):
+def send_command_and_receive_response(command, serial_port, poll_interval = 1):
     # Send command to Arduino
+    # poll_interval: seconds to sleep between reads, 0 to rely on the serial port timeout
     no_response = True
     response = None
     serial_port.flush()
-    radius = str(command[0])
-    theta = str(command[1])
-    direction = str(command[2])
-    theta2 = str(command[3])
-    msg_send = radius + "," + theta + "," + direction + "," + theta2
+    msg_send = command_message(command) + "\n" #the sketch reads up to the newline instead of waiting out its timeout
     msg_send = msg_send.encode() #'utf-8'
     # Send message in the form of radius,theta
     serial_port.write(msg_send)
 
     # While no response is received, keep checking for response
     while no_response:
-        time.sleep(1)
+        if poll_interval:
+            time.sleep(poll_interval)
         response = serial_port.readline().decode()
         if response is not None and len(response) > 0:
             print("Message from arduino: ", response)
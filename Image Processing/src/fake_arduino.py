@@ -0,0 +1,127 @@
+# fake_arduino pretends to be the Stepper_Control.ino sketch on a pseudo
+# terminal, so the serial code can be tried without the machine (Linux/macOS).
+# Like the sketch it reads a message, "moves" for a while and then replies
+# "Tasks Completed!". Messages are split on newlines, or on a pause in the data
+# like the sketch's Serial.readString() timeout when there is no newline.
+# Binary peg frames (src/framing.py) are decoded into received as peg lists.
+# Messages from src/transport.py ("#<seq>:<message>") are handled like the
+# sketch does: ids it already carried out are acked again without moving, and
+# the ack echoes the id ("Tasks Completed! #<seq>").
+#
+# Example:
+#   fake = FakeArduino(move_time = .05)
+#   fake.start()
+#   serial_port = serial.Serial(fake.port_name, 9600, timeout = .1)
+#   ...
+#   fake.stop()
+
+import os
+import select
+import threading
+import time
+import tty
+
+from src.framing import BAD_FRAME, FRAME_START, FrameError, decode_frame
+
+ACK = b"Tasks Completed!\r\n"
+
+
+class FakeArduino(threading.Thread):
+    """
+    Answers every message written to port_name with ACK after move_time seconds.
+
+    read_timeout -- pause in seconds that ends a message without a newline, like Serial.readString()
+    drop_every -- carry out but don't answer every drop_every-th message, to try out timeouts and retries (0 answers all)
+    batch_size -- answer to the "?BUF" query, None to ignore it like older sketches
+    """
+
+    def __init__(self, move_time = 0, read_timeout = .05, drop_every = 0, batch_size = 200):
+        threading.Thread.__init__(self, daemon = True)
+        self.move_time = move_time
+        self.read_timeout = read_timeout
+        self.drop_every = drop_every
+        self.batch_size = batch_size
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port_name = os.ttyname(self.slave)
+        self.received = [] #every message carried out, in order
+        self.repeated = [] #sequence ids that were sent again after they were carried out
+        self.last_seq = -1
+        self.stopped = False
+
+    def handle(self, message):
+        message = message.strip()
+        if not message:
+            return
+        if message == b"?BUF":
+            if self.batch_size is not None:
+                os.write(self.master, "BUF {}\r\n".format(self.batch_size).encode())
+            return
+        if message == b"?SEQ":
+            os.write(self.master, "SEQ {}\r\n".format(self.last_seq).encode())
+            return
+        seq = None
+        if message.startswith(b"#"):
+            seq, message = message[1:].split(b":", 1)
+            seq = int(seq)
+            if seq <= self.last_seq:
+                self.repeated.append(seq)
+                os.write(self.master, ACK.rstrip() + " #{}\r\n".format(seq).encode())
+                return
+            if seq > self.last_seq + 1 and self.last_seq >= 0: #an earlier message got lost
+                return
+            self.last_seq = seq
+        self.received.append(message.decode(errors = "replace"))
+        if message == b"Finished":
+            return
+        self.acknowledge(seq)
+
+    def handle_frame(self, buffer):
+        """Handles the frame at the start of buffer, returns what is left of the buffer or None if the frame isn't complete yet"""
+        try:
+            peg_list, buffer = decode_frame(buffer)
+        except FrameError as error:
+            if str(error) == "frame cut short":
+                return None
+            os.write(self.master, (BAD_FRAME + "\r\n").encode())
+            return b""
+        self.received.append(peg_list)
+        self.acknowledge()
+        return buffer
+
+    def acknowledge(self, seq = None):
+        time.sleep(self.move_time)
+        if self.drop_every and len(self.received) % self.drop_every == 0:
+            return
+        os.write(self.master, ACK if seq is None else ACK.rstrip() + " #{}\r\n".format(seq).encode())
+
+    def run(self):
+        buffer = b""
+        while not self.stopped:
+            ready, _, _ = select.select([self.master], [], [], self.read_timeout)
+            if ready:
+                buffer += os.read(self.master, 1024)
+                while buffer:
+                    if buffer[:1] == bytes([FRAME_START]):
+                        rest = self.handle_frame(buffer)
+                        if rest is None: #wait for the rest of the frame
+                            break
+                        buffer = rest
+                    elif b"\n" in buffer:
+                        message, buffer = buffer.split(b"\n", 1)
+                        self.handle(message)
+                    else:
+                        break
+            elif buffer[:1] == bytes([FRAME_START]): #frame cut short, like the sketch's readBytes timeout
+                os.write(self.master, (BAD_FRAME + "\r\n").encode())
+                buffer = b""
+            elif buffer: #pause in the data ends the message
+                self.handle(buffer)
+                buffer = b""
+
+    def stop(self):
+        self.stopped = True
+        self.join()
+        os.close(self.master)
+        os.close(self.slave)
@@ -0,0 +1,111 @@
+# framing packs (peg_num, move_type) batches into compact binary frames for
+# Stepper_Control.ino instead of "peg,peg,...;move,move,..." strings, so the
+# sketch doesn't have to parse text with String.substring.
+#
+# Frame layout:
+#   FRAME_START (0xA5)
+#   count         1 byte, number of pegs in the frame
+#   pegs          count * 2 bytes, big endian peg_num << 1 | move_type
+#   checksum      1 byte, CRC-8 (polynomial 0x07) of count and pegs
+#
+# The batch size comes from the machine: it answers the "?BUF" query with
+# "BUF <max pegs per frame>".
+
+import time
+
+FRAME_START = 0xA5
+MAX_FRAME_PEGS = 255
+BUFFER_QUERY = b"?BUF\n"
+ACK = "Tasks Completed!"
+BAD_FRAME = "Bad Frame!"
+
+
+class FrameError(ValueError):
+    """Raised when a frame is cut short or its checksum doesn't match"""
+
+
+def crc8(data, crc = 0):
+    """CRC-8 with polynomial 0x07, same as crc8() in Stepper_Control.ino"""
+    for byte in data:
+        crc ^= byte
+        for i in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def encode_frame(peg_list):
+    """Packs a list of (peg_num, move_type) tuples into one frame"""
+    if len(peg_list) > MAX_FRAME_PEGS:
+        raise ValueError("a frame holds at most {} pegs, got {}".format(MAX_FRAME_PEGS, len(peg_list)))
+    body = bytearray([len(peg_list)])
+    for peg_num, move_type in peg_list:
+        value = peg_num << 1 | (move_type & 1)
+        body += bytes([value >> 8, value & 0xFF])
+    return bytes([FRAME_START]) + bytes(body) + bytes([crc8(body)])
+
+
+def decode_frame(data):
+    """Unpacks the frame at the start of data. Returns the list of (peg_num, move_type) tuples and the bytes after the frame."""
+    if len(data) < 3 or data[0] != FRAME_START:
+        raise FrameError("no frame start")
+    count = data[1]
+    end = 2 + 2*count
+    if len(data) < end + 1:
+        raise FrameError("frame cut short")
+    if crc8(data[1:end]) != data[end]:
+        raise FrameError("checksum mismatch")
+    peg_list = []
+    for i in range(2, end, 2):
+        value = data[i] << 8 | data[i + 1]
+        peg_list.append((value >> 1, value & 1))
+    return peg_list, data[end + 1:]
+
+
+def split_into_batches(peg_list, batch_size):
+    return [peg_list[index:index + batch_size] for index in range(0, len(peg_list), batch_size)]
+
+
+def drain_input(serial_port, quiet_reads = 3):
+    """Throws away replies that are still on the way, until quiet_reads reads in a row time out with nothing.
+    Needs a read timeout on the port."""
+    quiet = 0
+    while quiet < quiet_reads:
+        quiet = 0 if serial_port.readline() else quiet + 1
+
+
+def negotiate_batch_size(serial_port, default = 20, attempts = 3):
+    """Asks the machine how many pegs fit in one frame. Falls back to default for sketches that don't answer."""
+    for attempt in range(attempts):
+        serial_port.write(BUFFER_QUERY)
+        response = serial_port.readline().decode(errors = "replace").strip()
+        if response.startswith("BUF "):
+            if attempt:
+                drain_input(serial_port) #answers to the earlier queries, so they aren't taken for acks later
+            return min(int(response.split()[1]), MAX_FRAME_PEGS)
+    drain_input(serial_port)
+    return default
+
+
+def send_frame_and_receive_response(peg_list, serial_port, retries = 2, timeout = 30):
+    """
+    Sends a batch of (peg_num, move_type) tuples as one frame and waits until the machine finishes it.
+    The frame is sent again if the machine reports a bad checksum. Other lines (like late "BUF" answers) are skipped.
+    Needs a read timeout on the port.
+
+    timeout -- seconds to wait for an answer per peg in the frame before giving up with a TimeoutError,
+               like a machine that was unplugged mid-frame. The frame isn't sent again, the machine may be moving it
+    """
+    frame = encode_frame(peg_list)
+    for attempt in range(retries + 1):
+        serial_port.write(frame)
+        deadline = time.monotonic() + timeout*len(peg_list)
+        response = ""
+        while response not in (ACK, BAD_FRAME):
+            if time.monotonic() > deadline:
+                raise TimeoutError("no answer from the machine to a frame of {} pegs in {:g}s".format(len(peg_list), timeout*len(peg_list)))
+            response = serial_port.readline().decode(errors = "replace").strip()
+            if response:
+                print("Message from arduino: ", response)
+        if response == ACK:
+            return response
+    raise FrameError("machine rejected the frame {} times".format(retries + 1))
@@ -0,0 +1,131 @@
+# headless runs the string art solver to completion without a pygame window,
+# so peg lists can be generated on a server without a display.
+#
+# Run from the Image Processing folder:
+#   python -m src.headless pokeball.jpeg --pegs 90 --radius .75 --max-string 2000
+
+import argparse
+import json
+import os
+import sys
+import time
+try:
+    import resource
+except ImportError: #not available on Windows
+    resource = None
+
+from src.simulation import ImageProcessor
+from src.cache import ImageCache
+
+
+def default_output_dir(file_name, peg_num, real_radius):
+    """Names the output folder like the files in src/Results, e.g. pokeball_90_075_result"""
+    name = os.path.splitext(os.path.basename(file_name))[0]
+    return name + "_{}_{}".format(peg_num, real_radius).replace(".", "") + "_result"
+
+
+def peak_rss():
+    """Returns the peak resident memory of this process in bytes, or None where it can't be read"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak*1024 #bytes on macOS, kilobytes elsewhere
+
+
+def run_job(file_name, output_dir = None, peg_num = 36, string_thickness = 1, max_lines = 1000,
+            real_radius = .75, max_overlap = 5, max_string = None, engine = "numpy", cache_dir = None, motion_weight = 0,
+            line_model = "legacy", pyramid_size = None, contrast = 0, edges = 0):
+    """
+    Computes the full peg list for an image and writes the results to output_dir:
+    peg_list.txt -- comma separated peg numbers
+    summary.json -- settings, string used, estimated machine time, number of lines, timings and peak memory
+    render.png -- the lines drawn on a blank image
+
+    engine -- "numpy", "pil" or "lowmem" for very high peg counts, see ImageProcessor
+    cache_dir -- optional folder to cache preprocessed images and line indexes in between runs
+    motion_weight -- trades image quality for machine time, see ImageProcessor
+    line_model -- "legacy" or "antialiased", see ImageProcessor
+    pyramid_size -- pick lines on a coarse copy of the image this many pixels across, see ImageProcessor
+    contrast, edges -- optional contrast stretch and edge enhancement, see preprocess.py
+
+    Returns the summary dictionary.
+    """
+    if output_dir is None:
+        output_dir = default_output_dir(file_name, peg_num, real_radius)
+
+    start = time.time()
+    cache = ImageCache(cache_dir) if cache_dir is not None else None
+    image = ImageProcessor(file_name, peg_num = peg_num, string_thickness = string_thickness,
+                            max_lines = max_lines, real_radius = real_radius,
+                            max_overlap = max_overlap, engine = engine, show_original = False, cache = cache,
+                            motion_weight = motion_weight, line_model = line_model, pyramid_size = pyramid_size,
+                            contrast = contrast, edges = edges)
+    setup_time = time.time() - start
+
+    peg_list = image.find_peg_list(max_string)
+    solve_time = time.time() - start - setup_time
+
+    summary = dict(
+        file_name = file_name,
+        peg_num = peg_num,
+        string_thickness = string_thickness,
+        max_lines = max_lines,
+        real_radius = real_radius,
+        max_overlap = max_overlap,
+        max_string = max_string,
+        engine = engine,
+        motion_weight = motion_weight,
+        line_model = line_model,
+        pyramid_size = pyramid_size,
+        contrast = contrast,
+        edges = edges,
+        lines = len(peg_list) - 1,
+        string_used = image.total_string_cost,
+        machine_time = float(image.total_motion_time),
+        setup_time = setup_time,
+        solve_time = solve_time,
+        peak_rss = peak_rss(),
+        )
+
+    os.makedirs(output_dir, exist_ok = True)
+    with open(os.path.join(output_dir, "peg_list.txt"), "w") as f:
+        f.write(",".join(str(peg) for peg in peg_list) + "\n")
+    with open(os.path.join(output_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent = 4)
+    image.comparison_image.save(os.path.join(output_dir, "render.png"))
+
+    return summary
+
+
+def parse_args(args = None):
+    parser = argparse.ArgumentParser(description = "Compute a string art peg list without a display.")
+    parser.add_argument("file_name", help = "image to process")
+    parser.add_argument("-o", "--output-dir", help = "folder for the results (default: <image>_<pegs>_<radius>_result)")
+    parser.add_argument("--pegs", type = int, default = 36, help = "number of pegs")
+    parser.add_argument("--thickness", type = int, default = 1, help = "string thickness in pixels")
+    parser.add_argument("--max-lines", type = int, default = 1000, help = "maximum number of lines")
+    parser.add_argument("--radius", type = float, default = .75, help = "board radius in feet")
+    parser.add_argument("--max-overlap", type = int, default = 5, help = "times a line can be drawn")
+    parser.add_argument("--max-string", type = float, default = None, help = "spool length in feet")
+    parser.add_argument("--engine", choices = ["numpy", "pil", "lowmem"], default = "numpy", help = "residual image engine")
+    parser.add_argument("--cache-dir", default = None, help = "folder to cache preprocessed images and lines in")
+    parser.add_argument("--motion-weight", type = float, default = 0, help = "discount per second of machine time, 0 ignores it")
+    parser.add_argument("--line-model", choices = ["legacy", "antialiased"], default = "legacy", help = "how lines cover pixels")
+    parser.add_argument("--pyramid-size", type = int, default = None, help = "pick lines on a coarse image this many pixels across")
+    parser.add_argument("--contrast", type = float, default = 0, help = "percent of dark and light pixels to clip stretching the contrast")
+    parser.add_argument("--edges", type = float, default = 0, help = "how much to darken edges, 0 to leave the image as is")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    summary = run_job(os.path.abspath(args.file_name), output_dir = args.output_dir, peg_num = args.pegs,
+                    string_thickness = args.thickness, max_lines = args.max_lines,
+                    real_radius = args.radius, max_overlap = args.max_overlap,
+                    max_string = args.max_string, engine = args.engine, cache_dir = args.cache_dir,
+                    motion_weight = args.motion_weight, line_model = args.line_model,
+                    pyramid_size = args.pyramid_size, contrast = args.contrast, edges = args.edges)
+    print("{} lines, {} ft of string, about {} min on the machine, solved in {:.2f}s".format(summary["lines"],
+        round(summary["string_used"], 1), round(summary["machine_time"]/60), summary["solve_time"]))
+    if summary["peak_rss"] is not None:
+        print("peak memory {:.0f} MB".format(summary["peak_rss"]/1e6))
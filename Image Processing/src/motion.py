@@ -0,0 +1,132 @@
+# motion estimates how long the string art machine takes to carry out moves, so
+# the solver can weigh image quality against build time. The speeds come from
+# Stepper_Control.ino: the board turns at 0.8 rev/s (motor) and the dispenser
+# moves at 150 mm/s, both faster while wrapping around a peg. Every move is
+# timed as a trapezoid: speed up, cruise, slow down.
+#
+# Geometry follows compute_directions.compile_peg_list: the dispenser sits at
+# .90 of the radius on one side of the center ("N") or the other ("S") and the
+# board turns the next peg to whichever side is closer. The dispenser only
+# moves across the board when that side changes. Then it wraps around the peg
+# and the board turns towards the peg after it. The side and angle carry over
+# from move to move, so a move's time depends on the machine state, see
+# next_moves.
+
+import numpy as np
+
+#Stepper_Control.ino uses -79/13*1.1429, where -79/13 is integer division in C
+GEAR_RATIO = abs(int(-79/13)*1.1429) #motor revolutions per board revolution
+FEET_TO_MM = 25.4*12/1.038 #moveRadius() including its experimental offset
+WRAP_FACTOR = .08 #how far the dispenser goes in/out when wrapping, as a fraction of the radius
+CROSS_RADIUS = .90 #loop_around_peg keeps the dispenser at .90 of the radius
+
+THETA_SPEED = .8 #motor rev/s
+THETA_ACCELERATION = .8 #motor rev/s^2
+R_SPEED = 150 #mm/s
+R_ACCELERATION = 170 #mm/s^2
+WRAP_THETA_SPEED = 2
+WRAP_THETA_ACCELERATION = 2
+WRAP_R_SPEED = 200
+WRAP_R_ACCELERATION = 250
+
+
+def move_time(distance, speed, acceleration):
+    """Time in seconds to move distance from rest to rest with a trapezoidal speed profile (works on arrays)"""
+    distance = np.abs(distance)
+    full_speed = distance >= speed**2/acceleration
+    return np.where(full_speed, distance/speed + speed/acceleration, 2*np.sqrt(distance/acceleration))
+
+
+def theta_time(degrees, speed = THETA_SPEED, acceleration = THETA_ACCELERATION):
+    """Time to turn the board by degrees"""
+    return move_time(np.asarray(degrees)/360*GEAR_RATIO, speed, acceleration)
+
+
+def r_time(feet, speed = R_SPEED, acceleration = R_ACCELERATION):
+    """Time to move the dispenser by feet along the radius"""
+    return move_time(np.asarray(feet)*FEET_TO_MM, speed, acceleration)
+
+
+def wrap_time(half_step, real_radius):
+    """Time to wrap around a peg, like wrapAround() in Stepper_Control.ino: three radial moves and two turns of one peg"""
+    wrap_r = r_time(real_radius*WRAP_FACTOR, WRAP_R_SPEED, WRAP_R_ACCELERATION)
+    wrap_theta = theta_time(2*half_step, WRAP_THETA_SPEED, WRAP_THETA_ACCELERATION)
+    return float(3*wrap_r + 2*wrap_theta)
+
+
+def command_time(command, half_step, real_radius):
+    """Estimated time of a [dr, dtheta, direction, dtheta2] command from compute_directions.
+    The radial and angular moves run at the same time, then the wrap and the turn towards the next peg."""
+    dr, dtheta, direction, dtheta2 = command
+    return float(max(r_time(dr), theta_time(dtheta)) + wrap_time(half_step, real_radius) + theta_time(dtheta2))
+
+
+def program_time(program, peg_num, real_radius, theta_speed = THETA_SPEED, r_speed = R_SPEED):
+    """Estimated time of a compiled program (see compute_directions.compile_peg_list), in seconds.
+    theta_speed (motor rev/s) and r_speed (mm/s) are the cruise speeds outside of wraps."""
+    half_step = 180/peg_num
+    moves = np.maximum(r_time(program["dr"], r_speed), theta_time(program["dtheta"], theta_speed))
+    turns = theta_time(program["dtheta2"], theta_speed)
+    return float(np.sum(moves + turns) + len(program)*wrap_time(half_step, real_radius))
+
+
+def next_moves(peg_num, real_radius, location, peg, direction, pegs):
+    """
+    One step of compute_directions.compile_peg_list for many next pegs at once.
+    The machine has just wrapped around peg, reached from direction ("N" or "S", None at the start of a job where
+    the first peg isn't wrapped), and the dispenser is at location [r, theta] before turning towards the next peg.
+    Returns, as arrays over pegs: dtheta2 (the turn that ends the command of peg), then the dr, dtheta and direction
+    of the command to each next peg and the location after wrapping around it.
+    """
+    half_step = 180/peg_num
+    r_current, theta_current = location
+    peg_location = 360/peg_num*peg
+    peg_location2 = 360/peg_num*np.asarray(pegs, dtype=np.float64)
+
+    if direction is None:
+        dtheta2 = np.zeros_like(peg_location2)
+    else:
+        target = peg_location2 + 180 if direction == "S" else peg_location2
+        diff1 = target - theta_current
+        diff2 = (360 - np.abs(diff1))*-np.sign(diff1)
+        dtheta2 = np.where(np.abs(diff1) <= np.abs(diff2), diff1, diff2)
+        dtheta2 = np.where(dtheta2 < 0, dtheta2 - half_step, dtheta2 + half_step)
+        dtheta2 = np.where(target == peg_location, 0, dtheta2)
+    theta_current = (theta_current + dtheta2)%360
+
+    #same side decision as loop_around_peg
+    target_0 = peg_location2 - half_step
+    target_1 = target_0 - 360
+    loc_B180 = (theta_current + 180)%360
+    diff_0, diff_1 = np.abs(target_0 - theta_current), np.abs(target_1 - theta_current)
+    north = np.minimum(diff_0, diff_1) <= np.minimum(np.abs(target_0 - loc_B180), np.abs(target_1 - loc_B180))
+    dtheta = np.where(north, np.where(diff_0 <= diff_1, target_0, target_1) - theta_current,
+                      np.where(np.abs(target_0 - loc_B180) <= np.abs(target_1 - loc_B180), target_0, target_1) - loc_B180)
+    r_next = np.where(north, CROSS_RADIUS*real_radius, -CROSS_RADIUS*real_radius)
+    theta_next = ((theta_current + dtheta)%360 + 2*half_step)%360
+    return dtheta2, r_next - r_current, dtheta, np.where(north, "N", "S"), r_next, theta_next
+
+
+def step_times(peg_num, real_radius, dtheta2, dr, dtheta):
+    """Time of the turn ending one command plus the move and wrap of the next, timed like program_time"""
+    return theta_time(dtheta2) + np.maximum(r_time(dr), theta_time(dtheta)) + wrap_time(180/peg_num, real_radius)
+
+
+def next_move_times(peg_num, real_radius, location, peg, direction, pegs):
+    """
+    Estimated time from a machine state (see next_moves) to each of pegs: the turn ending the current command,
+    the move to the next peg and the wrap around it.
+    Summed over a peg list, plus final_turn_time at the end, this is program_time of its compiled program.
+    """
+    return step_times(peg_num, real_radius, *next_moves(peg_num, real_radius, location, peg, direction, pegs)[:3])
+
+
+def advance(peg_num, real_radius, location, peg, direction, next_peg):
+    """Moves a machine state (see next_moves) on to next_peg. Returns the time it takes, the new location and direction."""
+    dtheta2, dr, dtheta, directions, r_next, theta_next = next_moves(peg_num, real_radius, location, peg, direction, [next_peg])
+    return float(step_times(peg_num, real_radius, dtheta2, dr, dtheta)[0]), (float(r_next[0]), float(theta_next[0])), str(directions[0])
+
+
+def final_turn_time(peg_num, real_radius, location, peg, direction):
+    """Time of the turn compile_peg_list gives the last peg of a list, which has no next peg to turn towards"""
+    return float(theta_time(next_moves(peg_num, real_radius, location, peg, direction, [peg])[0][0]))
@@ -0,0 +1,277 @@
+# multicolor solves string art with several thread colors. Every color gets a
+# layer: its own residual (how much of that color the image still needs), its
+# own current peg and its own peg list. The residuals are stacked in one array
+# so every step scores the lines from each layer's current peg in one numpy
+# call, like ImageProcessor.score_lines_from does for one color, and draws the
+# best line of any color.
+#
+# The peg geometry and the line index come from an ImageProcessor on the same
+# image, so the cache and the legacy line model work the same way.
+#
+# Colors are either "cmy", where cyan, magenta and yellow threads take the red,
+# green and blue the image is missing (a red pixel needs magenta and yellow),
+# or a palette of thread colors, where every pixel goes to its nearest thread
+# color with its distance from the white board as the residual.
+#
+# Run from the Image Processing folder:
+#   python -m src.multicolor pokeball.jpeg --pegs 90 --colors cmy --max-string 3000
+#   python -m src.multicolor pokeball.jpeg --pegs 90 --colors e02020 202020 --color-change-cost .5
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from src.simulation import ImageProcessor
+from src.cache import ImageCache
+from src.preprocess import circle_mask, crop_square, load_array
+
+CMY = [(0, 255, 255), (255, 0, 255), (255, 255, 0)]
+
+
+def parse_color(color):
+    """Turns a hex color like "e02020" or "#e02020" into an (r, g, b) tuple"""
+    color = color.lstrip("#")
+    if len(color) != 6:
+        raise ValueError("colors are 6 hex digits, got {!r}".format(color))
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def color_name(color):
+    return "{:02x}{:02x}{:02x}".format(*color)
+
+
+class MultiColorProcessor:
+    """Finds one peg list per thread color, drawing the best line of any color at every step."""
+
+    def __init__(self, file_name, colors = "cmy", peg_num = 36, string_thickness = 1, max_lines = 3000, real_radius = .75,
+                 max_overlap = 5, color_change_cost = 0, cache = None):
+        """
+        colors -- "cmy" or a list of (r, g, b) thread colors
+        max_lines -- lines of all colors together
+        max_overlap -- times a line can be drawn, in any color
+        color_change_cost -- a line in another color than the last one needs (1 + color_change_cost) times the fit,
+                             so the machine changes thread less often. 0 ignores color changes
+        cache -- optional cache.ImageCache, see ImageProcessor
+        """
+        #pegs, line index, string costs and the square crop of the image
+        self.image = ImageProcessor(file_name, peg_num = peg_num, string_thickness = string_thickness, max_lines = max_lines,
+                                    real_radius = real_radius, max_overlap = max_overlap, engine = "numpy",
+                                    show_original = False, cache = cache)
+        self.subtractive = colors == "cmy"
+        self.colors = np.array(CMY if self.subtractive else colors, dtype=np.float64)
+        self.peg_num = peg_num
+        self.max_lines = max_lines
+        self.max_overlap = max_overlap
+        self.color_change_cost = color_change_cost
+
+        self.np_original = self.load_original(file_name)
+        self.shape = self.np_original.shape[:2]
+        self.residuals = self.color_residuals(self.np_original)
+        self.reset()
+
+    def load_original(self, file_name):
+        """Returns the RGB image cropped to the same square as the ImageProcessor, white outside the circle"""
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        rgb = load_array(os.path.join(dir_path, file_name))
+        if rgb.ndim == 2:
+            rgb = np.repeat(rgb[:, :, None], 3, axis = 2)
+        rgb = crop_square(rgb, self.image.diameter)
+        return np.where(circle_mask(rgb.shape[:2])[:, :, None], rgb, 255).astype(np.float64)
+
+    def color_residuals(self, original):
+        """Returns a (colors, pixels) array of how much of each thread color every pixel needs, from 0 to 255"""
+        pixels = original.reshape(-1, 3)
+        if self.subtractive:
+            #cyan takes away red, magenta green and yellow blue
+            return (255 - pixels).T.copy()
+        distances = np.linalg.norm(pixels[None, :, :] - self.colors[:, None, :], axis = 2)
+        nearest = np.argmin(distances, axis = 0)
+        darkness = np.minimum(np.linalg.norm(255 - pixels, axis = 1)/np.sqrt(3), 255)
+        residuals = np.zeros((len(self.colors), len(pixels)))
+        residuals[nearest, np.arange(len(pixels))] = darkness
+        return residuals
+
+    def reset(self):
+        """Starts a new run on the same image"""
+        self.residual = self.residuals.copy()
+        self.render = np.full(self.np_original.shape, 255, dtype=np.float64)
+        self.current_pegs = np.zeros(len(self.colors), dtype=np.int64)
+        self.previous_pegs = [[0]*(self.peg_num//5) for color in self.colors]
+        self.histogram = np.zeros((self.peg_num, self.peg_num), dtype=np.uint8) #shared, overlapping threads of any color add up
+        self.steps = [] #(color, peg) in drawing order
+        self.last_color = None
+        self.total_string_cost = 0
+        self.string_costs = np.zeros(len(self.colors))
+
+    def score_layers(self):
+        """Scores the lines from every layer's current peg in one numpy call.
+        Returns a (colors, peg_num) array of line fits (0 for each layer's current peg)."""
+        layers = len(self.colors)
+        rows = self.image.pair_ids[self.current_pegs] #lines from each layer's current peg, -1 for the peg itself
+        lines = rows >= 0
+        pairs = rows[lines]
+        layer = np.repeat(np.arange(layers), self.peg_num - 1)
+        starts = self.image.line_offsets[pairs]
+        counts = self.image.line_offsets[pairs + 1] - starts
+
+        #gather every layer's lines back to back, reading each from its own residual
+        segment_starts = np.zeros(len(pairs), dtype=np.int64)
+        np.cumsum(counts[:-1], out = segment_starts[1:])
+        gather = np.arange(segment_starts[-1] + counts[-1]) + np.repeat(starts - segment_starts, counts)
+        pixels = self.image.line_pixels[gather] + np.repeat(layer, counts)*self.residual.shape[1]
+
+        scores = np.zeros((layers, self.peg_num))
+        scores[lines] = np.add.reduceat(self.residual.ravel()[pixels], segment_starts)
+        return scores
+
+    def candidate_scores(self):
+        """Scores every layer's lines, with the lines that can't be drawn next set to 0
+        and the other colors scored down by the color change cost"""
+        scores = self.score_layers()
+        if self.color_change_cost and self.last_color is not None:
+            others = np.arange(len(self.colors)) != self.last_color
+            scores[others] /= 1 + self.color_change_cost
+
+        candidates = self.histogram[self.current_pegs] < self.max_overlap
+        layers = np.arange(len(self.colors))
+        candidates[layers, self.current_pegs] = False
+        for color, previous_pegs in enumerate(self.previous_pegs):
+            candidates[color, previous_pegs] = False
+        scores[~candidates] = 0
+        return scores
+
+    def draw_line(self, color, peg_index):
+        """Draws a line of one color from its layer's current peg, erasing it from that layer's residual only"""
+        current = self.current_pegs[color]
+        footprint = self.image.line_footprint(current, peg_index)
+        self.residual[color].reshape(self.shape)[footprint] = 0
+        self.render[footprint] *= self.colors[color]/255
+
+        self.histogram[current, peg_index] += 1
+        self.histogram[peg_index, current] = self.histogram[current, peg_index]
+        cost = self.image.string_costs[self.image.pair_index(current, peg_index)]
+        self.string_costs[color] += cost
+        self.total_string_cost += cost
+
+        self.current_pegs[color] = peg_index
+        self.previous_pegs[color] = self.previous_pegs[color][1:] + [peg_index]
+        self.steps.append((color, peg_index))
+        self.last_color = color
+
+    def find_layers(self, max_string = None):
+        """Draws lines until no color has a line left that covers any value, max_lines or max_string.
+        Returns a peg list per color, each starting at peg 0."""
+        while len(self.steps) < self.max_lines:
+            if max_string is not None and self.total_string_cost >= max_string:
+                break
+            scores = self.candidate_scores()
+            color, peg_index = np.unravel_index(np.argmax(scores), scores.shape)
+            if scores[color, peg_index] <= 0:
+                break
+            self.draw_line(int(color), int(peg_index))
+        return self.layer_peg_lists()
+
+    def layer_peg_lists(self):
+        peg_lists = [[0] for color in self.colors]
+        for color, peg_index in self.steps:
+            peg_lists[color].append(peg_index)
+        return peg_lists
+
+    def color_changes(self):
+        """Number of times the thread changes color in drawing order"""
+        colors = [color for color, peg_index in self.steps]
+        return sum(1 for previous, color in zip(colors, colors[1:]) if previous != color)
+
+    def image_error(self):
+        """Mean squared error between the original and the rendered lines over all three channels"""
+        return float(np.mean((self.np_original - self.render)**2))
+
+    @property
+    def render_image(self):
+        return Image.fromarray(self.render.astype(np.uint8), 'RGB')
+
+
+def run_job(file_name, output_dir, colors = "cmy", peg_num = 36, string_thickness = 1, max_lines = 3000, real_radius = .75,
+            max_overlap = 5, max_string = None, color_change_cost = 0, cache_dir = None):
+    """
+    Solves an image in several colors and writes the results to output_dir:
+    layer_<n>_<color>.txt -- comma separated peg list of each color
+    steps.txt -- color,peg per line in drawing order
+    summary.json -- settings, string used per color, color changes, error and timings
+    render.png -- the lines drawn in their colors
+
+    Returns the summary dictionary.
+    """
+    start = time.time()
+    cache = ImageCache(cache_dir) if cache_dir is not None else None
+    processor = MultiColorProcessor(file_name, colors = colors, peg_num = peg_num, string_thickness = string_thickness,
+                                    max_lines = max_lines, real_radius = real_radius, max_overlap = max_overlap,
+                                    color_change_cost = color_change_cost, cache = cache)
+    setup_time = time.time() - start
+    peg_lists = processor.find_layers(max_string)
+    solve_time = time.time() - start - setup_time
+
+    names = [color_name(color) for color in processor.colors.astype(int)]
+    summary = dict(
+        file_name = file_name,
+        colors = names,
+        peg_num = peg_num,
+        string_thickness = string_thickness,
+        max_lines = max_lines,
+        real_radius = real_radius,
+        max_overlap = max_overlap,
+        max_string = max_string,
+        color_change_cost = color_change_cost,
+        lines = [len(peg_list) - 1 for peg_list in peg_lists],
+        string_used = [float(cost) for cost in processor.string_costs],
+        color_changes = processor.color_changes(),
+        mse = processor.image_error(),
+        setup_time = setup_time,
+        solve_time = solve_time,
+        )
+
+    os.makedirs(output_dir, exist_ok = True)
+    for layer, (name, peg_list) in enumerate(zip(names, peg_lists)):
+        with open(os.path.join(output_dir, "layer_{}_{}.txt".format(layer, name)), "w") as f:
+            f.write(",".join(str(peg) for peg in peg_list) + "\n")
+    with open(os.path.join(output_dir, "steps.txt"), "w") as f:
+        f.write("".join("{},{}\n".format(color, peg) for color, peg in processor.steps))
+    with open(os.path.join(output_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent = 4)
+    processor.render_image.save(os.path.join(output_dir, "render.png"))
+    return summary
+
+
+def parse_args(args = None):
+    parser = argparse.ArgumentParser(description = "Compute string art peg lists for several thread colors.")
+    parser.add_argument("file_name", help = "image to process")
+    parser.add_argument("-o", "--output-dir", help = "folder for the results (default: <image>_<pegs>_<radius>_colors)")
+    parser.add_argument("--colors", nargs = "+", default = ["cmy"], help = "cmy, or thread colors as hex like e02020")
+    parser.add_argument("--pegs", type = int, default = 36, help = "number of pegs")
+    parser.add_argument("--thickness", type = int, default = 1, help = "string thickness in pixels")
+    parser.add_argument("--max-lines", type = int, default = 3000, help = "maximum number of lines of all colors")
+    parser.add_argument("--radius", type = float, default = .75, help = "board radius in feet")
+    parser.add_argument("--max-overlap", type = int, default = 5, help = "times a line can be drawn")
+    parser.add_argument("--max-string", type = float, default = None, help = "string of all colors in feet")
+    parser.add_argument("--color-change-cost", type = float, default = 0, help = "discount on switching colors, 0 ignores it")
+    parser.add_argument("--cache-dir", default = None, help = "folder to cache preprocessed images and lines in")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    colors = "cmy" if args.colors == ["cmy"] else [parse_color(color) for color in args.colors]
+    output_dir = args.output_dir
+    if output_dir is None:
+        name = os.path.splitext(os.path.basename(args.file_name))[0]
+        output_dir = name + "_{}_{}".format(args.pegs, args.radius).replace(".", "") + "_colors"
+    summary = run_job(os.path.abspath(args.file_name), output_dir, colors = colors, peg_num = args.pegs,
+                    string_thickness = args.thickness, max_lines = args.max_lines, real_radius = args.radius,
+                    max_overlap = args.max_overlap, max_string = args.max_string,
+                    color_change_cost = args.color_change_cost, cache_dir = args.cache_dir)
+    print("{} lines, {} ft of string, {} color changes, solved in {:.2f}s".format(sum(summary["lines"]),
+        round(sum(summary["string_used"]), 1), summary["color_changes"], summary["solve_time"]))
@@ -0,0 +1,64 @@
+# pipeline streams solved pegs to the string art machine while the solver keeps
+# working ahead. The SolverThread puts pegs in a bounded queue, and the
+# CommandStreamer thread turns them into loop_around_peg commands and sends them
+# as soon as the Arduino acknowledges the previous one, so the total job time
+# comes down to the time the machine needs to move.
+
+import threading
+
+from src.compute_directions import loop_around_peg, send_command_and_receive_response
+
+
+class CommandStreamer(threading.Thread):
+    """
+    Takes (peg, string used) items from machine_queue until None and sends the commands
+    for each peg to the Arduino, waiting for its reply after every command.
+
+    Commands for a peg are only sent once the peg after it is known, since the wrap
+    around a peg depends on where the string goes next.
+
+    current_location, acknowledged -- machine position and pegs already finished, when resuming from a checkpoint
+    checkpointer -- optional checkpoint.Checkpointer, told about every acknowledged peg and when the job is done
+    """
+
+    def __init__(self, serial_port, machine_queue, peg_num, real_radius, current_location = None, acknowledged = 0,
+                checkpointer = None):
+        threading.Thread.__init__(self, daemon = True)
+        self.serial_port = serial_port
+        self.machine_queue = machine_queue
+        self.real_radius = real_radius
+        self.half_step = 180/peg_num
+        self.peg_locations = list([360/peg_num* i for i in range(peg_num)])
+        self.current_location = current_location if current_location is not None else [0,0] #r, theta (degrees)
+        self.acknowledged = acknowledged #number of pegs the machine has finished
+        self.checkpointer = checkpointer
+        self.error = None
+
+    def send_peg(self, peg, next_peg):
+        peg_location = self.peg_locations[peg]
+        next_location = self.peg_locations[next_peg]
+        self.current_location, commands = loop_around_peg(self.current_location, peg_location,
+                                                        self.half_step, self.real_radius, next_location)
+        for command in commands:
+            print("Sent: {}".format(command))
+            send_command_and_receive_response(command, self.serial_port, poll_interval = 0)
+        self.acknowledged += 1
+        if self.checkpointer is not None:
+            self.checkpointer.acknowledged(self)
+
+    def run(self):
+        peg = None
+        try:
+            while True:
+                item = self.machine_queue.get()
+                if item is None:
+                    break
+                if peg is not None:
+                    self.send_peg(peg, item[0])
+                peg = item[0]
+            if peg is not None:
+                self.send_peg(peg, peg) #last peg, nothing to wrap towards
+            if self.checkpointer is not None:
+                self.checkpointer.finish(self)
+        except Exception as error: #keep the error for the main loop instead of dying silently
+            self.error = error
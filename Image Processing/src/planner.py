@@ -0,0 +1,121 @@
+# planner reports what a job needs before the machine starts: string length,
+# wraps, radial and angular travel and the estimated machine time, so jobs can
+# be scheduled and spools checked without running them. The peg list is
+# compiled into the same commands loop_around_peg gives (see
+# compute_directions.compile_peg_list) and timed with motion.py.
+#
+# Run from the Image Processing folder:
+#   python -m src.planner --peg-list pokeball_90_075_result/peg_list.txt --pegs 90 --radius .75
+#   python -m src.planner --image pokeball.jpeg --pegs 90 --max-string 2000 --spool 2500
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from src.compute_directions import compile_peg_list
+from src.motion import R_SPEED, THETA_SPEED, program_time
+from src.simulation import ImageProcessor
+
+
+def string_length(peg_list, peg_num, real_radius):
+    """Total length of the chords between consecutive pegs, in the units of real_radius"""
+    pegs = np.asarray(peg_list)
+    steps = np.abs(np.diff(pegs))
+    return float(np.sum(2*real_radius*np.sin(np.pi*steps/peg_num)))
+
+
+def plan_peg_list(peg_list, peg_num, real_radius, spool = None, theta_speed = THETA_SPEED, r_speed = R_SPEED):
+    """
+    Returns a dictionary describing the job for a peg list:
+    lines, string_length (feet), wraps, crossings, radial_travel (feet), angular_travel (degrees),
+    machine_time (seconds) and, with a spool length, spool_left (feet, negative if it runs out).
+    """
+    half_step = 180/peg_num
+    current_location, program = compile_peg_list(peg_num, peg_list, real_radius)
+    length = string_length(peg_list, peg_num, real_radius)
+
+    plan = dict(
+        peg_num = peg_num,
+        real_radius = real_radius,
+        lines = len(peg_list) - 1,
+        string_length = length,
+        wraps = len(program),
+        crossings = int(np.count_nonzero(np.abs(program["dr"]) > real_radius)),
+        radial_travel = float(np.sum(np.abs(program["dr"]))),
+        angular_travel = float(np.sum(np.abs(program["dtheta"])) + np.sum(np.abs(program["dtheta2"])) + len(program)*2*half_step),
+        machine_time = program_time(program, peg_num, real_radius, theta_speed, r_speed),
+        )
+    if spool is not None:
+        plan["spool_left"] = spool - length
+    return plan
+
+
+def plan_image(file_name, peg_num = 36, string_thickness = 1, max_lines = 1000, real_radius = .75, max_overlap = 5,
+               max_string = None, spool = None, motion_weight = 0, theta_speed = THETA_SPEED, r_speed = R_SPEED):
+    """Solves an image without a display and plans its peg list. Returns the plan and the peg list."""
+    image = ImageProcessor(file_name, peg_num = peg_num, string_thickness = string_thickness, max_lines = max_lines,
+                            real_radius = real_radius, max_overlap = max_overlap, engine = "numpy",
+                            show_original = False, motion_weight = motion_weight)
+    peg_list = image.find_peg_list(max_string)
+    return plan_peg_list(peg_list, peg_num, real_radius, spool, theta_speed, r_speed), peg_list
+
+
+def read_peg_list(file_name):
+    """Reads a comma separated peg list like headless.py's peg_list.txt"""
+    with open(file_name) as f:
+        return [int(peg) for peg in f.read().replace("\n", ",").split(",") if peg.strip()]
+
+
+def format_plan(plan):
+    hours, seconds = divmod(int(round(plan["machine_time"])), 3600)
+    lines = ["{lines} lines, {string_length:.1f} ft of string".format(**plan),
+             "{wraps} wraps, {crossings} crossings".format(**plan),
+             "radial travel {radial_travel:.1f} ft, angular travel {turns:.1f} turns".format(turns = plan["angular_travel"]/360, **plan),
+             "estimated machine time {}h {:02d}m".format(hours, seconds//60)]
+    if "spool_left" in plan:
+        if plan["spool_left"] >= 0:
+            lines.append("{:.1f} ft of spool left".format(plan["spool_left"]))
+        else:
+            lines.append("NOT ENOUGH STRING: {:.1f} ft short".format(-plan["spool_left"]))
+    return "\n".join(lines)
+
+
+def parse_args(args = None):
+    parser = argparse.ArgumentParser(description = "Estimate the string and machine time a string art job needs.")
+    source = parser.add_mutually_exclusive_group(required = True)
+    source.add_argument("--peg-list", help = "comma separated peg list file, like peg_list.txt from headless")
+    source.add_argument("--image", help = "image to solve first")
+    parser.add_argument("--pegs", type = int, default = 36, help = "number of pegs")
+    parser.add_argument("--radius", type = float, default = .75, help = "board radius in feet")
+    parser.add_argument("--spool", type = float, default = None, help = "string on the spool in feet")
+    parser.add_argument("--theta-speed", type = float, default = THETA_SPEED, help = "board motor speed in rev/s")
+    parser.add_argument("--r-speed", type = float, default = R_SPEED, help = "dispenser speed in mm/s")
+    parser.add_argument("--thickness", type = int, default = 1, help = "string thickness in pixels (--image)")
+    parser.add_argument("--max-lines", type = int, default = 1000, help = "maximum number of lines (--image)")
+    parser.add_argument("--max-overlap", type = int, default = 5, help = "times a line can be drawn (--image)")
+    parser.add_argument("--max-string", type = float, default = None, help = "spool length to stop the solver at (--image)")
+    parser.add_argument("--motion-weight", type = float, default = 0, help = "discount per second of machine time (--image)")
+    parser.add_argument("-o", "--output", help = "JSON file to save the plan to")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    start = time.perf_counter()
+    if args.image:
+        plan, peg_list = plan_image(os.path.abspath(args.image), peg_num = args.pegs, string_thickness = args.thickness,
+                                    max_lines = args.max_lines, real_radius = args.radius, max_overlap = args.max_overlap,
+                                    max_string = args.max_string, spool = args.spool, motion_weight = args.motion_weight,
+                                    theta_speed = args.theta_speed, r_speed = args.r_speed)
+    else:
+        plan = plan_peg_list(read_peg_list(args.peg_list), args.pegs, args.radius, args.spool,
+                            args.theta_speed, args.r_speed)
+    print(format_plan(plan))
+    print("planned in {:.2f}s".format(time.perf_counter() - start))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(plan, f, indent = 4)
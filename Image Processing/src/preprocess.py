@@ -0,0 +1,103 @@
+# preprocess turns an image file into the residual image ImageProcessor starts
+# from, with numpy only: the file is decoded once, then cropped to a square,
+# turned into luminance, optionally contrast stretched, inverted, optionally
+# edge enhanced and masked to the board circle. Every step is an array
+# operation, so there are no PIL round trips between steps. Only the board
+# circle is drawn with PIL, so its edge matches the old pipeline pixel for pixel.
+#
+# Luminance uses the same fixed point weights as PIL's convert('L'), so the
+# gray levels are identical to the old PIL pipeline.
+#
+# Example:
+#   residual = preprocess("pokeball.jpeg", contrast = 1, edges = .5)
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+def load_array(path):
+    """Decodes an image file into a uint8 array, (height, width) for grayscale images and (height, width, 3) otherwise"""
+    with Image.open(path) as image:
+        if image.mode not in ("L", "RGB"):
+            image = image.convert("RGB")
+        return np.asarray(image)
+
+
+def crop_square(array, diameter = None):
+    """Crops the center square of side diameter (the shorter side by default)"""
+    height, width = array.shape[:2]
+    if diameter is None:
+        diameter = min(height, width)
+    left, top = (width - diameter)//2, (height - diameter)//2
+    return array[top:top + diameter, left:left + diameter]
+
+
+def luminance(array, rows = 128):
+    """Returns the gray levels of an RGB array like PIL's convert('L'): (R*19595 + G*38470 + B*7471 + 0x8000) >> 16.
+    Works through a few rows at a time so the 32 bit sums stay in cache."""
+    if array.ndim == 2:
+        return array
+    height, width = array.shape[:2]
+    gray = np.empty((height, width), dtype=np.uint8)
+    total = np.empty((rows, width), dtype=np.uint32)
+    channel = np.empty((rows, width), dtype=np.uint32)
+    for top in range(0, height, rows):
+        block = array[top:top + rows]
+        block_total, block_channel = total[:len(block)], channel[:len(block)]
+        np.multiply(block[..., 0], np.uint32(19595), out = block_total, dtype=np.uint32)
+        np.multiply(block[..., 1], np.uint32(38470), out = block_channel, dtype=np.uint32)
+        block_total += block_channel
+        np.multiply(block[..., 2], np.uint32(7471), out = block_channel, dtype=np.uint32)
+        block_total += block_channel
+        block_total += 0x8000
+        block_total >>= 16
+        gray[top:top + rows] = block_total
+    return gray
+
+
+def circle_mask(shape):
+    """Returns a boolean array that is True inside the ellipse touching the edges of an array of this shape.
+    Drawn with ImageDraw.ellipse((0, 0) + size) like the old PIL pipeline, since the edge pixels it picks are
+    where every line starts and ends."""
+    height, width = shape
+    mask = Image.new('L', (width, height), 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, width, height), fill=255)
+    return np.asarray(mask) > 0
+
+
+def stretch_contrast(gray, cutoff = 1, mask = None):
+    """Stretches the gray levels between the cutoff and 100 - cutoff percentiles (of the masked pixels) to 0-255,
+    like PIL's ImageOps.autocontrast"""
+    low, high = np.percentile(gray[mask] if mask is not None else gray, [cutoff, 100 - cutoff])
+    if high <= low:
+        return gray
+    return np.clip((gray - low)*(255/(high - low)) + .5, 0, 255).astype(np.uint8)
+
+
+def edge_strength(gray):
+    """Returns the gradient magnitude of a gray image from central differences, from 0 to 255"""
+    gray = gray.astype(np.float32)
+    dx = np.zeros_like(gray)
+    dy = np.zeros_like(gray)
+    dx[:, 1:-1] = gray[:, 2:] - gray[:, :-2]
+    dy[1:-1, :] = gray[2:, :] - gray[:-2, :]
+    return np.minimum(np.hypot(dx, dy)/2, 255)
+
+
+def preprocess(path, contrast = 0, edges = 0):
+    """
+    Returns the preprocessed image as a square uint8 array: dark parts of the image are high values
+    and everything outside the board circle is 0.
+
+    contrast -- percent of the darkest and lightest pixels to clip when stretching the contrast, 0 to leave it
+    edges -- how much of the edge strength to add, so outlines get more string. 0 to leave it
+    """
+    gray = luminance(crop_square(load_array(path)))
+    mask = circle_mask(gray.shape)
+    if contrast:
+        gray = stretch_contrast(gray, contrast, mask)
+    residual = 255 - gray
+    if edges:
+        residual = np.clip(residual + edges*edge_strength(gray), 0, 255).astype(np.uint8)
+    residual *= mask
+    return residual
@@ -1,27 +1,50 @@
-import pygame
+try:
+    import pygame
+except ImportError: #pygame is only needed for the live System display
+    pygame = None
 from math import floor, pi, cos, sin, hypot
-from time import sleep
-from operator import itemgetter
 import numpy as np
-from PIL import Image, ImageDraw, ImageOps
-from itertools import combinations
-from bokeh.layouts import gridplot
-from bokeh.plotting import figure, show, output_file, show
+from PIL import Image, ImageDraw
+import mmap
+import queue
+import tempfile
+import threading
+try:
+    from bokeh.plotting import figure, show
+except ImportError: #bokeh is only needed for plot_mean_squared_error
+    figure = None
 import os
+try:
+    from src.motion import advance, final_turn_time, next_move_times
+    from src.preprocess import preprocess
+except ImportError: #run as a script from inside src
+    from motion import advance, final_turn_time, next_move_times
+    from preprocess import preprocess
+
+ROW_CHUNK_LINES = 128 #lines rasterized at once while building the lowmem row index
+FOOTPRINT_STRIP = 64 #pixels along a wide line read back from the scratch image at once, see line_footprint
 
 
 class System:
 
     """ System is a class that processes the live Pygame display of the string art simulator."""
 
-    def __init__(self, window_size, peg_num = 36, string_thickness = 1, peg_size = 5):
-        """Initializes Pygame window with given settings."""
+    def __init__(self, window_size, peg_num = 36, string_thickness = 1, peg_size = 5, dirty_rects = False):
+        """Initializes Pygame window with given settings.
+
+        dirty_rects -- only redraw the pegs and update the parts of the window that changed since the last update
+        """
 
         self.window_size = window_size
+        self.use_dirty_rects = dirty_rects
+        self.dirty_rects = None #rectangles changed since the last update, None to update the whole window
+        self.stale_pegs = set() #indexes of pegs that lines may have been drawn over
+        self.string_used_text = None
         self.font = pygame.font.SysFont('tlwgtypewriter', 30)
         self.text_position = [window_size[0]//10, window_size[1]//10]
 
         self.peg_num = peg_num
+        self.histogram = np.zeros((peg_num, peg_num), dtype=np.uint8) #times each line was drawn, histogram[i, j] == histogram[j, i]
 
         #initializing properties needed to render Pygame display
         self.screen_properties = dict(
@@ -47,13 +70,24 @@ class System:
                             self.screen_properties["board_radius"])
         pygame.display.flip()
         self.create_pegs()
+        self.create_peg_sprites()
         self.refresh_pegs()
 
 
 
     def update_window(self):
         """Updates Pygame Display"""
-        pygame.display.flip()
+        if self.use_dirty_rects and self.dirty_rects is not None:
+            pygame.display.update(self.dirty_rects)
+        else:
+            pygame.display.flip()
+        self.dirty_rects = []
+        self.stale_pegs = set()
+
+    def add_dirty_rect(self, rect):
+        """Marks part of the window as changed for the next update_window"""
+        if self.dirty_rects is not None:
+            self.dirty_rects.append(rect)
 
 
     def create_pegs(self):
@@ -73,20 +107,34 @@ class System:
 
         self.screen_properties["pegs"] = peg_locations
         self.current_peg = self.screen_properties["pegs"][0]
+        self.current_peg_index = 0
+
+    def create_peg_sprites(self):
+        """Renders the peg and highlighted peg circles once so refresh_pegs only has to blit them"""
+        size = self.screen_properties["peg_size"]
+        sprites = []
+        for color in [self.screen_properties["peg_color"], self.screen_properties["peg_highlight"]]:
+            sprite = pygame.Surface((2*size + 1, 2*size + 1), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, color, (size, size), size)
+            sprites.append(sprite)
+        self.peg_sprite, self.highlight_sprite = sprites
 
     def refresh_pegs(self):
-        """Redraws pegs on display so they are not covered by lines"""
+        """Redraws pegs on display so they are not covered by lines.
+        With dirty_rects only the pegs next to lines drawn since the last update are redrawn."""
+
+        size = self.screen_properties["peg_size"]
+        pegs = self.screen_properties["pegs"]
+        if self.use_dirty_rects and self.dirty_rects is not None:
+            indexes = self.stale_pegs
+        else:
+            indexes = range(self.peg_num)
 
-        for location in self.screen_properties["pegs"]:
-            pygame.draw.circle(self.screen,
-                                self.screen_properties["peg_color"],
-                                location,
-                                self.screen_properties["peg_size"])
+        rects = self.screen.blits([(self.peg_sprite, (pegs[i][0] - size, pegs[i][1] - size)) for i in indexes])
         #highlight current peg
-        pygame.draw.circle(self.screen,
-                            self.screen_properties["peg_highlight"],
-                            self.current_peg,
-                            self.screen_properties["peg_size"])
+        rects.append(self.screen.blit(self.highlight_sprite, (self.current_peg[0] - size, self.current_peg[1] - size)))
+        for rect in rects:
+            self.add_dirty_rect(rect)
 
     def process_click(self):
         """Draws line to the peg closest to mouse click"""
@@ -98,26 +146,40 @@ class System:
                         self.current_peg, closest_peg, self.screen_properties["string_thickness"])
 
         self.current_peg = closest_peg
+        self.current_peg_index = self.screen_properties["pegs"].index(closest_peg)
+        self.dirty_rects = None
         self.refresh_pegs()
         self.update_window()
 
-    def draw_line_to(self, peg_index):
-        """Draws line to given peg"""
+    def draw_line_to(self, peg_index, refresh = True):
+        """Draws line to given peg
+        refresh -- redraws the pegs on top of the line, turn off when drawing many lines at once
+        """
         last_peg = self.current_peg
         current_peg = self.screen_properties["pegs"][peg_index]
         # pygame.draw.line(self.screen, self.screen_properties["string_color"],
         #                 last_peg, current_peg, self.screen_properties["string_thickness"])
-        pygame.draw.aaline(self.screen, self.screen_properties["string_color"],
+        line_rect = pygame.draw.aaline(self.screen, self.screen_properties["string_color"],
                         last_peg, current_peg, True)
+        self.add_dirty_rect(line_rect)
+
+        #the line can cover its end pegs and the pegs right next to them
+        for index in [self.current_peg_index, peg_index]:
+            self.stale_pegs.update([(index - 1) % self.peg_num, index, (index + 1) % self.peg_num])
 
         self.current_peg = current_peg
-        self.refresh_pegs()
+        self.current_peg_index = peg_index
+        if refresh:
+            self.refresh_pegs()
 
     def update_string_used(self, string_used):
-        """Updates string used metric on display"""
+        """Updates string used metric on display, only rendering the text again when it changes"""
         string_used = "{} ft".format(round(string_used, 1))
+        if string_used == self.string_used_text:
+            return
+        self.string_used_text = string_used
         new_display = self.font.render(string_used, False, (255, 255, 255, 255), (0,0,0,0))
-        self.screen.blit(new_display, self.text_position)
+        self.add_dirty_rect(self.screen.blit(new_display, self.text_position))
 
     def draw_mesh(self, peg_list):
         """Draws a mesh from peg to peg.
@@ -133,6 +195,8 @@ class System:
 
 
         self.current_peg = self.screen_properties["pegs"][peg_list[-1]] #last peg in list becomes the peg to start for process_click()
+        self.current_peg_index = peg_list[-1]
+        self.dirty_rects = None
         self.refresh_pegs()
         self.update_window()
 
@@ -154,34 +218,155 @@ class System:
 
         return True, next_peg
 
+    def draw_queued_lines(self, peg_queue):
+        """Function to run in live loop with a SolverThread. Draws every line the solver queued since the last frame,
+        then redraws the pegs, string used and window once.
+        Returns False once the solver is finished and the queue is empty."""
+        running = True
+        string_used = None
+        while True:
+            try:
+                item = peg_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None: #solver is done
+                running = False
+                break
+            next_peg, string_used = item
+            self.draw_line_to(next_peg, refresh = False)
+
+        if string_used is not None:
+            self.refresh_pegs()
+            self.update_string_used(string_used)
+            self.update_window()
+        return running
+
     def add_to_histogram(self, peg_1, peg_2):
         """Tracks which pegs have lines drawn across them already to avoid too much overlap"""
 
-        self.histogram[frozenset([peg_1, peg_2])] = self.histogram.get(frozenset([peg_1, peg_2]), 0) + 1
+        self.histogram[peg_1, peg_2] += 1
+        self.histogram[peg_2, peg_1] = self.histogram[peg_1, peg_2]
 
     def add_image_information(self, ImageProcessor):
         """Adds information to Pygame GUI"""
         data = "{} pegs : {} ft radius : {} max-overlap".format(self.peg_num, ImageProcessor.real_radius, ImageProcessor.max_overlap)
         new_display = self.font.render(data, False, (255, 255, 255, 255), (0,0,0,0))
-        self.screen.blit(new_display, [int(.1/10*self.window_size[0]), int(0/10*self.window_size[1])])
+        self.add_dirty_rect(self.screen.blit(new_display, [int(.1/10*self.window_size[0]), int(0/10*self.window_size[1])]))
+
+class SolverThread(threading.Thread):
+    """Runs an ImageProcessor in the background so solving isn't held back by the display.
+    Every chosen peg is put in peg_queue as (peg, total_string_cost), followed by None when the solver is done.
+    With a machine_queue the pegs are also put there. Give it a maxsize to limit how far the solver runs ahead of the machine.
+    max_string -- string length to stop at, None to keep going
+    max_lines -- lines to stop at, None to keep going until max_string runs out or no line helps
+    peg_list -- pegs solved so far when resuming from a checkpoint (see checkpoint.py), starts at the current peg if None
+    Hold lock while reading the ImageProcessor from another thread."""
+
+    def __init__(self, ImageProcessor, peg_queue, max_string = None, machine_queue = None, peg_list = None, max_lines = None):
+        threading.Thread.__init__(self, daemon = True)
+        self.image = ImageProcessor
+        self.peg_queue = peg_queue
+        self.machine_queue = machine_queue
+        self.max_string = max_string
+        self.max_lines = max_lines
+        self.peg_list = list(peg_list) if peg_list is not None else [ImageProcessor.current_index]
+        self.lock = threading.Lock() #held while the solver changes the ImageProcessor
+        self.running = threading.Event() #cleared while paused
+        self.running.set()
+        self.stopped = False
+
+    def run(self):
+        lines = len(self.peg_list) - 1
+        while not self.stopped and (self.max_lines is None or lines < self.max_lines):
+            self.running.wait()
+            if self.max_string is not None and self.image.total_string_cost >= self.max_string:
+                break
+            lines += 1
+            with self.lock:
+                last_peg = self.image.current_index
+                next_peg = self.image.find_next_peg()
+                if next_peg == last_peg:
+                    break
+                self.image.mean_squared_error()
+                self.peg_list.append(next_peg)
+            self.peg_queue.put((next_peg, self.image.total_string_cost))
+            if self.machine_queue is not None:
+                self.machine_queue.put((next_peg, self.image.total_string_cost)) #waits while the machine is too far behind
+        self.peg_queue.put(None)
+        if self.machine_queue is not None:
+            self.machine_queue.put(None)
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def stop(self):
+        self.stopped = True
+        self.running.set()
+
 
 class ImageProcessor:
     """This class takes an image and does the computing to determine where to draw the lines."""
 
-    def __init__(self, file_name, peg_num = 36, string_thickness = 1, max_lines = 1000, real_radius = .75, max_overlap = 5):
-        """Initializes ImageProcessor Object"""
+    def __init__(self, file_name, peg_num = 36, string_thickness = 1, max_lines = 1000, real_radius = .75, max_overlap = 5, engine = "pil", show_original = False, cache = None, solver = None, motion_weight = 0, line_model = "legacy",
+                pyramid_size = None, refine_top = 8, contrast = 0, edges = 0):
+        """Initializes ImageProcessor Object
+
+        engine -- "pil" redraws each line on the PIL image and rebuilds np_image from it,
+                  "numpy" keeps np_image as the persistent residual and only erases the pixels a line covers
+                  (the pixels PIL would draw, see line_footprint, so both engines give the same pegs),
+                  "lowmem" is the numpy engine with uint8 images and the line index in a memory-mapped file
+                  (see build_row_index), so memory stays flat for very high peg counts. Gives the same pegs as "numpy"
+        show_original -- pops up the processed original image
+        cache -- optional cache.ImageCache to reuse the preprocessed image and line index of earlier runs
+        solver -- optional object with a next_peg(ImageProcessor) method (see solvers.py), greedy compute_best_path if None
+        motion_weight -- how much each second of machine time (see motion.py) discounts a line, on top of the quickest move
+                         from where the machine is (which side of the board the dispenser is on, see motion.next_moves).
+                         A line that takes one second longer needs (1 + motion_weight) times the fit. 0 ignores machine time
+        line_model -- "legacy" samples each line one pixel per step like the original solver,
+                      "antialiased" weighs every pixel by how much of it a string of string_thickness covers,
+                      for scoring, erasing and the comparison image alike (needs the numpy engine)
+        pyramid_size -- diameter in pixels of a coarse copy of the residual to pick lines on, None to score at full resolution.
+                        Only the coarse line index is built, so large images don't need a full resolution one.
+                        The full resolution residual, original and comparison images are still kept, as uint8 like lowmem,
+                        so memory still grows by a few bytes per pixel of the image (plus decoding it once)
+                        (needs the numpy engine and the legacy line model)
+        refine_top -- in pyramid mode, how many of the best coarse lines are scored again at full resolution
+        contrast, edges -- optional contrast stretch and edge enhancement of the image, see preprocess.py
+        """
+        if line_model not in ("legacy", "antialiased"):
+            raise ValueError("unknown line_model {!r}".format(line_model))
+        if line_model == "antialiased" and engine != "numpy":
+            raise ValueError("the antialiased line model needs the numpy engine")
+        if pyramid_size is not None and (engine != "numpy" or line_model != "legacy"):
+            raise ValueError("pyramid mode needs the numpy engine and the legacy line model")
 
         self.peg_num = peg_num
+        self.engine = engine
+        #dtype of the residual and comparison images, uint8 where lines only ever set pixels to 0
+        self.pixel_type = np.uint8 if engine == "lowmem" or pyramid_size is not None else np.float64
+        self.line_model = line_model
+        self.pyramid_size = pyramid_size
+        self.refine_top = refine_top
         self.max_lines = max_lines
         self.string_thickness = string_thickness
         self.real_radius = real_radius
         self.total_string_cost = 0 #How much string we've used so far in feet
+        self.motion_weight = motion_weight
+        self.motion_time = 0 #Estimated machine time of the moves so far in seconds, see total_motion_time
+        self.machine_location = (0, 0) #[r, theta] of the dispenser after wrapping around the current peg, see motion.next_moves
+        self.machine_direction = None #side the current peg was reached from, None before the first move
         self.max_overlap = max_overlap
+        self.cache = cache
+        self.solver = solver
 
         #Open image file
         dir_path = os.path.dirname(os.path.realpath(__file__))
-        self.image = Image.open(dir_path+"/"+file_name)
-        self.image_size = self.image.size
+        path = os.path.join(dir_path, file_name)
+        with Image.open(path) as image: #only reads the header
+            self.image_size = image.size
         print("Original Image Size: ", self.image_size)
         self.diameter = floor(min(self.image_size))
 
@@ -189,18 +374,28 @@ class ImageProcessor:
         self.previous_pegs = list([0 for i in range(peg_num//5)])
         self.current_index = 0
 
-
-        self.crop_image_to_square()
-
-        self.turn_image_grayscale()
-        self.invert_image()
-        self.crop_circle()
-        self.original = ImageOps.invert(self.image)
-        self.original.show()
+        processed = cache.load_image(path, self.diameter, contrast, edges) if cache is not None else None
+        if processed is None:
+            processed = preprocess(path, contrast = contrast, edges = edges)
+            if cache is not None:
+                cache.save_image(path, self.diameter, processed, contrast, edges)
+        processed = np.asarray(processed)
+        self.image_size = (processed.shape[1], processed.shape[0])
+        self.image_center = [self.image_size[0]//2, self.image_size[1]//2]
+        self.image = Image.fromarray(processed, 'L') #for the pil engine and previews
+
+        self.np_original = (255 - processed).astype(self.pixel_type)
+        #the blank image is all 255, so its squared error is the sum of processed**2, counted per gray level
+        self.blank_squared_error = float(np.bincount(processed.ravel(), minlength = 256) @ np.arange(256.0)**2)
+        if show_original:
+            self.original.show()
         self.create_pegs()
         # self.show_pegs()
 
-        self.np_image = np.asarray(self.image.getdata(),dtype=np.float64).reshape((self.image.size[1], self.image.size[0]))
+        self.np_image = processed.astype(self.pixel_type)
+        self.image_synced = True #False when np_image has lines the PIL image doesn't show yet
+        self.line_canvas = None #scratch image line_footprint draws wide lines on, made on first use
+        self.preprocessed_image = processed #kept so new runs can start without reprocessing the file
 
         self.compute_lines()
 
@@ -209,41 +404,117 @@ class ImageProcessor:
         self.M2Error_list = [] #attribute to save mean_squared_error in list
         self.plot_steps = 0
 
-        self.error_plot = figure( title="Image Error")
-        self.error_plot.xaxis.axis_label = 'String Used'
-
-
-    def create_blank_image(self):
-        """Creates a blank image to compare against the original image to calculate error"""
-        self.comparison_image = Image.new('L', self.image_size, 255)
 
-    def draw_line_on_comparison(self, peg_index):
-        """Draws lines on comparison image for error calculation"""
-        draw = ImageDraw.Draw(self.comparison_image)
-        draw.line([self.pegs[self.current_index], self.pegs[peg_index]], fill=0, width = self.string_thickness)
-
-    def crop_image_to_square(self):
-        crop_rectangle =((self.image_size[0]-self.diameter)//2,
-                        (self.image_size[1]-self.diameter)//2,
-                        (self.image_size[0]+self.diameter)//2,
-                        (self.image_size[1]+self.diameter)//2)
-        self.image = self.image.crop(crop_rectangle)
-        self.image_size = self.image.size
-        self.image_center = [self.image.size[0]//2, self.image.size[1]//2]
+    def reset(self, string_thickness = None, max_overlap = None, max_lines = None):
+        """Starts a new run on the same image and pegs, reusing the preprocessed image and the line index."""
+        if string_thickness is not None and string_thickness != self.string_thickness:
+            self.string_thickness = string_thickness
+            if self.line_model != "legacy": #the line weights depend on the thickness
+                self.compute_lines()
+        if max_overlap is not None:
+            self.max_overlap = max_overlap
+        if max_lines is not None:
+            self.max_lines = max_lines
+
+        self.np_image = self.preprocessed_image.astype(self.pixel_type)
+        self.image_synced = False
+        self.sync_image()
+        if self.pyramid_size is not None:
+            self.sync_coarse_image()
+
+        self.previous_pegs = list([0 for i in range(self.peg_num//5)])
+        self.current_index = 0
+        self.total_string_cost = 0
+        self.motion_time = 0
+        self.machine_location = (0, 0)
+        self.machine_direction = None
+        self.histogram.fill(0)
 
+        self.create_blank_image()
+        self.M2Error_list = []
+        self.plot_steps = 0
 
-    def turn_image_grayscale(self):
-        self.image = self.image.convert('L')
+    def solver_state(self):
+        """Returns the state of a run as a dictionary of arrays, to save with checkpoint.py.
+        The line index isn't included, it only depends on the image and the settings."""
+        return dict(
+            peg_num = self.peg_num,
+            diameter = self.diameter,
+            string_thickness = self.string_thickness,
+            max_overlap = self.max_overlap,
+            real_radius = self.real_radius,
+            residual = self.np_image,
+            comparison = self.np_comparison,
+            squared_error_sum = self.squared_error_sum,
+            histogram = self.histogram[np.triu_indices(self.peg_num, k = 1)], #in pair_index order
+            previous_pegs = np.array(self.previous_pegs),
+            current_index = self.current_index,
+            total_string_cost = self.total_string_cost,
+            motion_time = self.motion_time,
+            machine_location = np.array(self.machine_location),
+            machine_direction = self.machine_direction or "",
+            error_list = np.array(self.M2Error_list).reshape(-1, 2),
+            )
 
-    def invert_image(self):
-        self.image = ImageOps.invert(self.image)
+    def restore_solver_state(self, state):
+        """Continues a run from a solver_state dictionary, on the same image with the same peg_num, string_thickness,
+        max_overlap and real_radius"""
+        for setting in ["peg_num", "diameter", "string_thickness", "max_overlap", "real_radius"]:
+            if float(state[setting]) != float(getattr(self, setting)):
+                raise ValueError("checkpoint has {} {:g}, this image has {:g}".format(setting, float(state[setting]), float(getattr(self, setting))))
+        self.np_image = np.array(state["residual"], dtype=self.pixel_type)
+        self.image_synced = False
+        self.sync_image()
+        if self.pyramid_size is not None:
+            self.sync_coarse_image()
+        self.np_comparison = np.array(state["comparison"], dtype=self.pixel_type)
+        self.squared_error_sum = float(state["squared_error_sum"])
+        peg_1, peg_2 = np.triu_indices(self.peg_num, k = 1)
+        self.histogram[peg_1, peg_2] = state["histogram"]
+        self.histogram[peg_2, peg_1] = state["histogram"]
+        self.previous_pegs = [int(peg) for peg in state["previous_pegs"]]
+        self.current_index = int(state["current_index"])
+        self.total_string_cost = float(state["total_string_cost"])
+        self.motion_time = float(state["motion_time"])
+        self.machine_location = tuple(float(value) for value in state["machine_location"])
+        self.machine_direction = str(state["machine_direction"]) or None
+        self.M2Error_list = [list(point) for point in np.asarray(state["error_list"]).tolist()]
+        self.plot_steps = len(self.M2Error_list)
+
+    def set_peg_num(self, peg_num):
+        """Changes the number of pegs without reprocessing the image, recomputing the pegs and lines only."""
+        self.peg_num = peg_num
+        self.create_pegs()
+        self.compute_lines()
+        self.reset()
 
-    def crop_circle(self):
-        black_image = Image.new('L', self.image_size, 0)
-        mask = Image.new('L', self.image_size, 0)
-        draw = ImageDraw.Draw(mask)
-        draw.ellipse((0, 0) + self.image_size, fill=255)
-        self.image = Image.composite(self.image, black_image, mask)
+    def create_blank_image(self):
+        """Creates a blank image to compare against the original image to calculate error,
+        along with the running sum of squared differences between the two"""
+        self.np_comparison = np.full(self.np_original.shape, 255, dtype=self.pixel_type)
+        self.squared_error_sum = self.blank_squared_error
+
+    @property
+    def original(self):
+        """PIL image of the cropped, grayscale original the lines are compared against"""
+        return Image.fromarray(self.np_original.astype(np.uint8), 'L')
+
+    @property
+    def comparison_image(self):
+        """PIL image of the lines drawn so far"""
+        return Image.fromarray(self.np_comparison.astype(np.uint8), 'L')
+
+    def draw_line_on_comparison(self, peg_index, footprint = None):
+        """Draws lines on comparison image for error calculation.
+        Only the pixels under the line change, so only their part of the squared error sum is updated.
+        footprint -- line_footprint of the line, if it was already computed"""
+        if footprint is None:
+            footprint = self.line_footprint(self.current_index, peg_index)
+        original = self.np_original[footprint].astype(np.float64)
+        old = self.np_comparison[footprint].astype(np.float64)
+        new = old*(1 - self.line_coverage(self.current_index, peg_index))
+        self.squared_error_sum += np.sum((original - new)**2 - (original - old)**2)
+        self.np_comparison[footprint] = new
 
     def create_pegs(self):
         """Creates a list of peg locations on the circular image"""
@@ -262,72 +533,538 @@ class ImageProcessor:
 
     def show_pegs(self):
         """Show where pegs are positioned on the image (for debugging)"""
+        self.sync_image()
         draw = ImageDraw.Draw(self.image)
         draw.point(self.pegs, fill=255)
 
+    def pair_index(self, peg_1, peg_2):
+        """Returns the integer id of the line between two pegs, the order of the pegs doesn't matter.
+        Ids follow the order of combinations(range(peg_num), 2)."""
+        i, j = min(peg_1, peg_2), max(peg_1, peg_2)
+        return i*(2*self.peg_num - i - 1)//2 + j - i - 1
+
     def compute_lines(self):
-        """Compute possible lines across pegs and create a dictionary of lengths to keep track of string costsself.
-            Lines are computed as lists of point indexes."""
-
-        peg_combinations = combinations(range(self.peg_num), 2)
-        self.line_dict = {}
-        self.string_cost_dict = {}
-        self.histogram = {}
-
-        for index_set in peg_combinations:
-            peg_1 = self.pegs[index_set[0]]
-            peg_2 = self.pegs[index_set[1]]
-            length = int(np.hypot(peg_2[0] - peg_1[0], peg_2[1] - peg_1[1]))
-            xs = np.linspace(peg_1[0]-2, peg_2[0]-2, length).tolist()
-            ys = np.linspace(peg_1[1]-2, peg_2[1]-2, length).tolist()
-            xs = list(map(int, xs))
-            ys = list(map(int, ys))
-
-            self.line_dict[frozenset([index_set[0], index_set[1]])] = [xs, ys]
-            self.string_cost_dict[frozenset([index_set[0], index_set[1]])] = self.real_radius/(self.diameter/2)*length
-            self.histogram[frozenset([index_set[0], index_set[1]])] = 0
+        """Compute possible lines across pegs and create an array of lengths to keep track of string costs.
+            Lines are stored in a compact CSR-style index: the flat pixel offsets of line number pair_index(i, j)
+            are line_pixels[line_offsets[pair]:line_offsets[pair + 1]]."""
+
+        peg_1, peg_2 = np.triu_indices(self.peg_num, k = 1) #same order as pair_index
+
+        #pair_ids[i, j] gives the line id between peg i and peg j (-1 on the diagonal)
+        self.pair_ids = np.full((self.peg_num, self.peg_num), -1, dtype=np.int32)
+        self.pair_ids[peg_1, peg_2] = np.arange(len(peg_1))
+        self.pair_ids[peg_2, peg_1] = np.arange(len(peg_1))
+
+        if self.pyramid_size is not None:
+            #index the lines on the coarse residual only, full resolution lines are rasterized when needed
+            self.pyramid_factor = max(1, int(np.ceil(self.diameter/self.pyramid_size)))
+            height, width = self.np_image.shape
+            self.coarse_shape = ((height + self.pyramid_factor - 1)//self.pyramid_factor,
+                                (width + self.pyramid_factor - 1)//self.pyramid_factor)
+            pegs = np.array(self.pegs, dtype=np.float64)
+            self.line_offsets, self.line_pixels, coarse_lengths = self.build_line_index((pegs - 2)/self.pyramid_factor,
+                                                                                        self.coarse_shape, offset = 0)
+            self.line_lengths = self.full_line_lengths()
+            self.line_weights = None
+            self.sync_coarse_image()
+        elif self.engine == "lowmem":
+            #the pixels are read from the memory-mapped row index one peg at a time, see build_row_index
+            self.line_lengths = self.full_line_lengths()
+            self.line_offsets = self.line_pixels = self.line_weights = None
+            self.open_row_index()
+        else:
+            lines = None
+            if self.cache is not None:
+                lines = self.cache.load_lines(self.diameter, self.peg_num, self.string_thickness, self.line_model)
+            if lines is None:
+                lines = self.build_line_index() if self.line_model == "legacy" else self.build_antialiased_line_index()
+                if self.cache is not None:
+                    self.cache.save_lines(self.diameter, self.peg_num, self.string_thickness, *lines, line_model = self.line_model)
+            #line_weights[k] is how much of pixel line_pixels[k] the string covers (0-255), None if lines cover whole pixels
+            self.line_offsets, self.line_pixels, self.line_lengths = lines[:3]
+            self.line_weights = lines[3] if len(lines) > 3 else None
+
+        self.string_costs = self.real_radius/(self.diameter/2)*self.line_lengths
+        #histogram[i, j] counts the times the line between peg i and peg j was drawn, kept symmetric
+        self.histogram = np.zeros((self.peg_num, self.peg_num), dtype=np.uint8)
+
+    def full_line_lengths(self):
+        """Lengths in pixels of every line in pair_index order, the same as build_line_index returns"""
+        pegs = np.array(self.pegs, dtype=np.float64)
+        peg_1, peg_2 = np.triu_indices(self.peg_num, k = 1)
+        return np.hypot(pegs[peg_2, 0] - pegs[peg_1, 0], pegs[peg_2, 1] - pegs[peg_1, 1]).astype(np.int64)
+
+    def build_line_index(self, pegs = None, shape = None, offset = 2):
+        """Computes the pixels of every line. Returns line_offsets, line_pixels and the line lengths in pixels.
+
+        pegs, shape -- peg positions and image shape to index, self.pegs and np_image's shape by default
+        offset -- pegs are moved up and left by offset pixels, like in the original solver
+        """
+        height, width = shape if shape is not None else self.np_image.shape
+        pegs = np.array(pegs if pegs is not None else self.pegs, dtype=np.float64)
+        peg_1, peg_2 = np.triu_indices(self.peg_num, k = 1)
+        lengths = np.hypot(pegs[peg_2, 0] - pegs[peg_1, 0], pegs[peg_2, 1] - pegs[peg_1, 1]).astype(np.int64)
+        pixel_counts = np.maximum(lengths, 1)
+
+        line_offsets = np.zeros(len(peg_1) + 1, dtype=np.int64)
+        np.cumsum(pixel_counts, out = line_offsets[1:])
+        pixel_type = np.int32 if height*width < 2**31 else np.int64
+        line_pixels = np.empty(line_offsets[-1], dtype=pixel_type)
+
+        #fill the index one starting peg at a time so temporary arrays stay small
+        for first_peg in range(self.peg_num - 1):
+            pairs = np.arange(self.pair_index(first_peg, first_peg + 1), self.pair_index(first_peg, self.peg_num - 1) + 1)
+            line_pixels[line_offsets[pairs[0]]:line_offsets[pairs[-1] + 1]] = self.rasterize_lines(
+                pegs[peg_1[pairs]] - offset, pegs[peg_2[pairs]] - offset, pixel_counts[pairs], (height, width))
+
+        return line_offsets, line_pixels, lengths
+
+    def rasterize_lines(self, starts, ends, counts, shape):
+        """Returns the flat pixel indexes of the lines from starts[k] to ends[k] (x, y) back to back,
+        sampled at counts[k] evenly spaced points truncated to whole pixels like the original solver."""
+        height, width = shape
+        offsets = np.cumsum(counts) - counts
+        #position of each pixel along its line
+        steps = np.arange(counts.sum()) - np.repeat(offsets, counts)
+        step_size = np.repeat((ends - starts)/np.maximum(counts - 1, 1)[:, None], counts, axis = 0)
+        xs = np.repeat(starts[:, 0], counts) + steps*step_size[:, 0]
+        ys = np.repeat(starts[:, 1], counts) + steps*step_size[:, 1]
+        #like np.linspace, end exactly on the second peg
+        last = (offsets + counts - 1)[counts > 1]
+        xs[last] = ends[counts > 1, 0]
+        ys[last] = ends[counts > 1, 1]
+        xs = np.clip(np.trunc(xs), 0, width - 1).astype(np.int64)
+        ys = np.clip(np.trunc(ys), 0, height - 1).astype(np.int64)
+        return ys*width + xs
+
+    def build_antialiased_line_index(self):
+        """Computes every line as the pixels covered by a string of string_thickness pixels between the exact
+        (unrounded) peg positions, with the fraction of each pixel it covers as a weight from 0 to 255.
+        Each column (row for steep lines) along the line gets the overlap of the string's cross section with
+        its pixels, and the columns at the ends only count the part before the peg.
+        Returns line_offsets, line_pixels, line_lengths and line_weights."""
+        height, width = self.np_image.shape
+        angles = 3/2*pi + np.arange(self.peg_num)*2*pi/self.peg_num
+        #pixel m covers m - .5 to m + .5
+        pegs = np.stack([self.image_size[0]/2 + self.diameter/2*np.cos(angles),
+                        self.image_size[1]/2 + self.diameter/2*np.sin(angles)], axis = 1) - .5
+        peg_1, peg_2 = np.triu_indices(self.peg_num, k = 1)
+        lengths = np.hypot(pegs[peg_2, 0] - pegs[peg_1, 0], pegs[peg_2, 1] - pegs[peg_1, 1])
+        slots = int(np.ceil(self.string_thickness*np.sqrt(2))) + 1 #most pixels the string crosses in one column
+        pixel_type = np.int32 if height*width < 2**31 else np.int64
+
+        pixel_counts = np.zeros(len(peg_1), dtype=np.int64)
+        pixel_chunks = []
+        weight_chunks = []
+        #one starting peg at a time so temporary arrays stay small
+        for first_peg in range(self.peg_num - 1):
+            pairs = np.arange(self.pair_index(first_peg, first_peg + 1), self.pair_index(first_peg, self.peg_num - 1) + 1)
+            start, end = pegs[peg_1[pairs]], pegs[peg_2[pairs]]
+            #walk along the major axis u, the string crosses the minor axis v
+            steep = np.abs(end[:, 1] - start[:, 1]) > np.abs(end[:, 0] - start[:, 0])
+            u_1, v_1 = np.where(steep, start[:, 1], start[:, 0]), np.where(steep, start[:, 0], start[:, 1])
+            u_2, v_2 = np.where(steep, end[:, 1], end[:, 0]), np.where(steep, end[:, 0], end[:, 1])
+            flip = u_2 < u_1
+            u_1, u_2, v_1, v_2 = np.where(flip, u_2, u_1), np.where(flip, u_1, u_2), np.where(flip, v_2, v_1), np.where(flip, v_1, v_2)
+            slope = (v_2 - v_1)/(u_2 - u_1)
+            half_width = self.string_thickness*np.sqrt(1 + slope**2)/2 #cross section along the minor axis
+
+            first_column = np.floor(u_1 + .5).astype(np.int64)
+            columns = np.floor(u_2 + .5).astype(np.int64) - first_column + 1
+            line = np.repeat(np.arange(len(pairs)), columns)
+            column = np.arange(columns.sum()) - np.repeat(np.cumsum(columns) - columns, columns) + first_column[line]
+            center = v_1[line] + (column - u_1[line])*slope[line]
+            along = np.clip(np.minimum(column + .5, u_2[line]) - np.maximum(column - .5, u_1[line]), 0, 1)
+            top = center - half_width[line]
+            bottom = center + half_width[line]
+            across_pixel = np.floor(top + .5).astype(np.int64)[:, None] + np.arange(slots)
+            across = np.clip(np.minimum(across_pixel + .5, bottom[:, None]) - np.maximum(across_pixel - .5, top[:, None]), 0, 1)
+            weights = np.rint(255*across*along[:, None]).astype(np.uint8)
+
+            xs = np.where(steep[line][:, None], across_pixel, column[:, None])
+            ys = np.where(steep[line][:, None], column[:, None], across_pixel)
+            keep = (weights > 0) & (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+            pixel_counts[pairs] = np.bincount(np.broadcast_to(line[:, None], keep.shape)[keep], minlength = len(pairs))
+            pixel_chunks.append((ys*width + xs)[keep].astype(pixel_type))
+            weight_chunks.append(weights[keep])
+
+        line_offsets = np.zeros(len(peg_1) + 1, dtype=np.int64)
+        np.cumsum(pixel_counts, out = line_offsets[1:])
+        return line_offsets, np.concatenate(pixel_chunks), lengths, np.concatenate(weight_chunks)
+
+    def sync_coarse_image(self):
+        """Recomputes the coarse residual of pyramid mode, the mean of every pyramid_factor x pyramid_factor block of np_image"""
+        factor = self.pyramid_factor
+        #sum the blocks one axis at a time so there is no full resolution float copy, blocks past the edge are short
+        rows = np.add.reduceat(self.np_image, np.arange(0, self.np_image.shape[0], factor), axis = 0, dtype=np.float64)
+        self.coarse_image = np.add.reduceat(rows, np.arange(0, self.np_image.shape[1], factor), axis = 1)/factor**2
+
+    def update_coarse_image(self, footprint, old_values):
+        """Carries a change of np_image at footprint over to the coarse residual of pyramid mode"""
+        factor = self.pyramid_factor
+        change = self.np_image[footprint].astype(np.float64) - old_values
+        np.add.at(self.coarse_image, (footprint[0]//factor, footprint[1]//factor), change/factor**2)
+
+    def lines_from(self, peg_index, others):
+        """Rasterizes the lines from peg_index to each peg in others like build_line_index.
+        Returns their flat pixel indexes back to back and the number of pixels of each line."""
+        pegs = np.array(self.pegs, dtype=np.float64) - 2
+        counts = np.maximum(self.line_lengths[self.pair_ids[peg_index, others]], 1)
+        #same direction as the index, from the lower peg to the higher one
+        pixels = self.rasterize_lines(pegs[np.minimum(peg_index, others)], pegs[np.maximum(peg_index, others)],
+                                    counts, self.np_image.shape)
+        return pixels, counts
+
+    def full_resolution_fits(self, peg_index, others):
+        """Sums np_image along the lines from peg_index to each peg in others, rasterized on the fly like build_line_index"""
+        pixels, counts = self.lines_from(peg_index, others)
+        return np.add.reduceat(self.np_image.ravel()[pixels], np.cumsum(counts) - counts, dtype=np.float64)
+
+    def build_row_index(self, folder):
+        """Writes the line index of the lowmem engine to folder, one row per peg:
+        row_pixels.bin holds the pixels of the lines from peg 0 to every other peg in order, then from peg 1 and so on,
+        and row_offsets.npy where each peg's row starts. Every line is stored twice so each solver step reads
+        one contiguous row, and only one row is in memory while writing."""
+        height, width = self.np_image.shape
+        pixel_type = np.int32 if height*width < 2**31 else np.int64
+        row_offsets = np.zeros(self.peg_num + 1, dtype=np.int64)
+        with open(os.path.join(folder, "row_pixels.bin"), "wb") as f:
+            for peg_index in range(self.peg_num):
+                others = np.delete(np.arange(self.peg_num), peg_index)
+                row_offsets[peg_index + 1] = row_offsets[peg_index]
+                #a few lines at a time, so temporary arrays don't grow with the peg count
+                for first in range(0, len(others), ROW_CHUNK_LINES):
+                    pixels, counts = self.lines_from(peg_index, others[first:first + ROW_CHUNK_LINES])
+                    f.write(pixels.astype(pixel_type).tobytes())
+                    row_offsets[peg_index + 1] += len(pixels)
+        np.save(os.path.join(folder, "row_offsets.npy"), row_offsets)
+
+    def open_row_index(self):
+        """Memory-maps the row index of the lowmem engine, from the cache or a temporary folder that lives as long as self"""
+        self.close_row_index()
+        folder = None
+        if self.cache is not None:
+            key = self.cache.row_lines_key(self.diameter, self.peg_num)
+            folder = self.cache.entry_path(key)
+            if folder is None:
+                self.cache.save_files(key, self.build_row_index)
+                folder = self.cache.entry_path(key)
+        if folder is None: #no cache, or the index was too big to stay in it
+            self.row_index_dir = tempfile.TemporaryDirectory(prefix = "stringomatic_")
+            folder = self.row_index_dir.name
+            self.build_row_index(folder)
+
+        height, width = self.np_image.shape
+        self.row_offsets = np.load(os.path.join(folder, "row_offsets.npy"))
+        with open(os.path.join(folder, "row_pixels.bin"), "rb") as f:
+            self.row_map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        self.row_pixels = np.frombuffer(self.row_map, dtype = np.int32 if height*width < 2**31 else np.int64)
+
+    def close_row_index(self):
+        if getattr(self, "row_map", None) is not None:
+            self.row_pixels = None #the array has to go before the map can close
+            self.row_map.close()
+        self.row_map = None
+        self.row_index_dir = None
+
+    def release_row(self, peg_index):
+        """Tells the OS it can drop the pages of a row the lowmem engine has read, so the rows visited
+        over a run don't pile up in memory. Does nothing where madvise isn't available."""
+        if not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        item_size = self.row_pixels.itemsize
+        start = int(self.row_offsets[peg_index])*item_size//mmap.PAGESIZE*mmap.PAGESIZE
+        end = int(self.row_offsets[peg_index + 1])*item_size
+        if end > start:
+            self.row_map.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+    def line_index_bytes(self):
+        """Bytes of line index held in memory, not counting a memory-mapped one"""
+        if self.line_pixels is None:
+            return self.row_offsets.nbytes
+        return self.line_pixels.nbytes + self.line_offsets.nbytes + (self.line_weights.nbytes if self.line_weights is not None else 0)
+
+    def line_slice(self, peg_1, peg_2):
+        pair = self.pair_index(peg_1, peg_2)
+        return slice(self.line_offsets[pair], self.line_offsets[pair + 1])
+
+    def line_fit(self, peg_1, peg_2):
+        """Sums the residual image value along the line between two pegs."""
+        if self.pyramid_size is not None or self.engine == "lowmem":
+            return self.full_resolution_fits(peg_1, np.array([peg_2]))[0]
+        line = self.line_slice(peg_1, peg_2)
+        values = self.np_image.ravel()[self.line_pixels[line]]
+        if self.line_weights is not None:
+            return np.sum(values*self.line_weights[line])/255
+        return np.sum(values)
+
+    def score_lines_from(self, peg_index):
+        """Scores every line leaving peg_index in one numpy call.
+        Returns an array of line fits indexed by the other peg (0 for peg_index itself)."""
+        others = np.delete(np.arange(self.peg_num), peg_index)
+        scores = np.zeros(self.peg_num)
+        if self.engine == "lowmem":
+            #the row already has the lines to every other peg back to back
+            counts = np.maximum(self.line_lengths[self.pair_ids[peg_index, others]], 1)
+            row = self.row_pixels[self.row_offsets[peg_index]:self.row_offsets[peg_index + 1]]
+            scores[others] = np.add.reduceat(self.np_image.ravel()[row], np.cumsum(counts) - counts, dtype=np.int64)
+            self.release_row(peg_index)
+            return scores
+
+        pairs = self.pair_ids[peg_index, others]
+        starts = self.line_offsets[pairs]
+        counts = self.line_offsets[pairs + 1] - starts
+
+        #gather the pixels of all the lines back to back and sum each line's segment
+        segment_starts = np.zeros(len(pairs), dtype=np.int64)
+        np.cumsum(counts[:-1], out = segment_starts[1:])
+        gather = np.arange(segment_starts[-1] + counts[-1]) + np.repeat(starts - segment_starts, counts)
+        residual = self.coarse_image if self.pyramid_size is not None else self.np_image
+        values = residual.ravel()[self.line_pixels[gather]]
+        if self.line_weights is None:
+            fits = np.add.reduceat(values, segment_starts)
+        else:
+            fits = np.add.reduceat(values*self.line_weights[gather], segment_starts)/255
+
+        scores[others] = fits
+        return scores
+
+    def overlap_counts(self, peg_index):
+        """Returns how many times each line leaving peg_index has been drawn, indexed by the other peg."""
+        return self.histogram[peg_index]
+
+    def candidate_scores(self):
+        """Scores every line from the current peg, with the lines that can't be drawn next
+        (back to the current peg, to previous_pegs or past max_overlap) set to 0.
+        With a motion_weight, lines that keep the machine busy longer are scored down."""
+        scores = self.score_lines_from(self.current_index)
+        if self.motion_weight:
+            extra_times = self.extra_motion_times()
+            scores /= 1 + self.motion_weight*extra_times
+
+        candidates = self.overlap_counts(self.current_index) < self.max_overlap
+        candidates[self.current_index] = False
+        candidates[self.previous_pegs] = False
+        scores[~candidates] = 0
+
+        if self.pyramid_size is not None:
+            #only the best lines on the coarse residual are scored again at full resolution
+            top = np.argsort(scores)[-self.refine_top:]
+            top = top[scores[top] > 0]
+            scores = np.zeros(self.peg_num)
+            scores[top] = self.full_resolution_fits(self.current_index, top)
+            if self.motion_weight:
+                scores[top] /= 1 + self.motion_weight*extra_times[top]
+        return scores
+
+    def extra_motion_times(self):
+        """Returns the seconds each move from the current peg takes over the quickest one, indexed by the next peg.
+        The times depend on which side of the board the dispenser is on, see motion.next_moves."""
+        times = next_move_times(self.peg_num, self.real_radius, self.machine_location, self.current_index,
+                                self.machine_direction, np.arange(self.peg_num))
+        times[self.current_index] = np.inf
+        return times - times.min()
+
+    @property
+    def total_motion_time(self):
+        """Estimated machine time so far in seconds, the same as motion.program_time of the compiled peg list"""
+        return self.motion_time + final_turn_time(self.peg_num, self.real_radius, self.machine_location,
+                                                  self.current_index, self.machine_direction)
+
+    def move_machine(self, peg_index):
+        """Moves the machine state from the current peg on to peg_index and adds the time it takes to motion_time"""
+        seconds, self.machine_location, self.machine_direction = advance(self.peg_num, self.real_radius, self.machine_location,
+                                                                         self.current_index, self.machine_direction, peg_index)
+        self.motion_time += seconds
 
     def compute_best_path(self):
         """Uses the greedy algorithm and finds the path across the peg board that covers the most pixel value."""
-        best_line = 0
-        best_index = 0
-        for index in range(self.peg_num):
-            if index == self.current_index or index in self.previous_pegs:
-                continue
-
-            if self.histogram[frozenset([self.current_index, index])] < self.max_overlap:
-                line = self.line_dict[frozenset([self.current_index, index])]
-                line_fit = np.sum(self.np_image[line[1], line[0]])
-                if line_fit > best_line:
-                    best_line = line_fit
-                    best_index = index
+        scores = self.candidate_scores()
 
+        #first peg with the highest positive fit, or peg 0 if no line covers any value
+        best_index = int(np.argmax(scores))
+        if scores[best_index] <= 0:
+            return 0
         return best_index
 
+    def line_footprint(self, peg_1, peg_2):
+        """Returns the (ys, xs) pixel indexes covered by a string of string_thickness between two pegs.
+        These are the pixels PIL's ImageDraw.line draws, so the numpy and pil engines erase the same lines."""
+        if self.line_weights is not None:
+            return np.unravel_index(self.line_pixels[self.line_slice(peg_1, peg_2)], self.np_image.shape)
+        x_1, y_1 = self.pegs[peg_1]
+        x_2, y_2 = self.pegs[peg_2]
+        height, width = self.np_image.shape
+
+        if self.string_thickness == 1:
+            #PIL's bresenham line from the first peg, with the minor axis stepping once the error reaches half a pixel
+            dx, dy = abs(x_2 - x_1), abs(y_2 - y_1)
+            step_x, step_y = (1 if x_2 >= x_1 else -1), (1 if y_2 >= y_1 else -1)
+            steps = np.arange(max(dx, dy) + 1)
+            if dx > dy:
+                xs = x_1 + step_x*steps
+                ys = y_1 + step_y*((2*steps*dy + dx)//(2*dx))
+            elif dy > 0:
+                ys = y_1 + step_y*steps
+                xs = x_1 + step_x*((2*steps*dx + dy)//(2*dy))
+            else:
+                xs, ys = np.array([x_1]), np.array([y_1])
+            inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+            return ys[inside], xs[inside]
+
+        #wide lines are filled polygons whose rounding changes when they are moved, so draw them with PIL on a
+        #scratch image with the same origin, but only read back a band around the line, a strip at a time,
+        #instead of its whole bounding box
+        if self.line_canvas is None:
+            self.line_canvas = Image.new('L', (width, height), 0)
+        draw = ImageDraw.Draw(self.line_canvas)
+        draw.line([(x_1, y_1), (x_2, y_2)], fill=255, width=self.string_thickness)
+        pad = self.string_thickness + 2
+        x_major = abs(x_2 - x_1) > abs(y_2 - y_1)
+        #a along the major axis, b along the minor one
+        a_1, b_1, a_2, b_2 = (x_1, y_1, x_2, y_2) if x_major else (y_1, x_1, y_2, x_2)
+        if a_1 > a_2:
+            a_1, b_1, a_2, b_2 = a_2, b_2, a_1, b_1
+        a_size, b_size = (width, height) if x_major else (height, width)
+        slope = (b_2 - b_1)/(a_2 - a_1) if a_2 > a_1 else 0
+        ys, xs = [], []
+        for start in range(max(a_1 - pad, 0), min(a_2 + pad + 1, a_size), FOOTPRINT_STRIP):
+            end = min(start + FOOTPRINT_STRIP, a_2 + pad + 1, a_size)
+            b_start = b_1 + slope*(min(max(start, a_1), a_2) - a_1)
+            b_end = b_1 + slope*(min(max(end - 1, a_1), a_2) - a_1)
+            low, high = max(floor(min(b_start, b_end)) - pad, 0), min(int(np.ceil(max(b_start, b_end))) + pad + 1, b_size)
+            box = (start, low, end, high) if x_major else (low, start, high, end)
+            strip_ys, strip_xs = np.nonzero(np.asarray(self.line_canvas.crop(box)))
+            ys.append(strip_ys + box[1])
+            xs.append(strip_xs + box[0])
+        #drawing it again in black leaves the scratch image blank for the next line
+        draw.line([(x_1, y_1), (x_2, y_2)], fill=0, width=self.string_thickness)
+        return np.concatenate(ys), np.concatenate(xs)
+
+    def line_coverage(self, peg_1, peg_2):
+        """Returns how much of each pixel of line_footprint the string covers, from 0 to 1 (1 for the legacy line model)"""
+        if self.line_weights is None:
+            return 1
+        return self.line_weights[self.line_slice(peg_1, peg_2)]/255
+
+    def erase_line(self, peg_1, peg_2, footprint = None):
+        """Erases value along a line directly in np_image, touching only the pixels the line covers
+        (line_footprint unless footprint is given)."""
+        if footprint is None:
+            footprint = self.line_footprint(peg_1, peg_2)
+        if self.pyramid_size is not None:
+            old_values = self.np_image[footprint]
+        if self.line_weights is None:
+            self.np_image[footprint] = 0
+        else:
+            #take off the darkness the string adds to the comparison image, so pixels drawn darker than the
+            #original go negative and count against the lines that would cross them again
+            self.np_image[footprint] -= self.np_comparison[footprint]*self.line_coverage(peg_1, peg_2)
+        if self.pyramid_size is not None:
+            self.update_coarse_image(footprint, old_values)
+        self.image_synced = False
+
+    def scored_pixels(self, peg_1, peg_2):
+        """Returns the flat indexes of the np_image pixels score_lines_from reads along a line"""
+        if self.line_pixels is not None and self.pyramid_size is None:
+            return self.line_pixels[self.line_slice(peg_1, peg_2)]
+        return self.lines_from(peg_1, np.array([peg_2]))[0]
+
+    def lookahead_footprint(self, peg_1, peg_2, footprint = None):
+        """Returns the (ys, xs) pixels try_line erases: line_footprint (or footprint) and, under the legacy line model,
+        the pixels the line is scored on, which sit two pixels off the drawn ones. Without them a line tried out
+        would not change the scores of the lines after it."""
+        if footprint is None:
+            footprint = self.line_footprint(peg_1, peg_2)
+        if self.line_weights is not None:
+            return footprint
+        pixels = np.concatenate([np.ravel_multi_index(footprint, self.np_image.shape), self.scored_pixels(peg_1, peg_2)])
+        return np.unravel_index(np.unique(pixels), self.np_image.shape)
+
+    def try_line(self, peg_index):
+        """Applies a line from the current peg to the solver state (residual, comparison image and error, histogram,
+        previous_pegs, current peg) without drawing it, so solvers can look ahead.
+        Returns the record undo_line needs to take it back."""
+        drawn = self.line_footprint(self.current_index, peg_index)
+        footprint = self.lookahead_footprint(self.current_index, peg_index, drawn)
+        record = (self.current_index, peg_index, footprint, self.np_image[footprint], list(self.previous_pegs),
+                  (self.motion_time, self.machine_location, self.machine_direction),
+                  (drawn, self.np_comparison[drawn], self.squared_error_sum))
+        self.erase_line(self.current_index, peg_index, footprint)
+        self.draw_line_on_comparison(peg_index, drawn)
+        self.add_to_histogram(self.current_index, peg_index)
+        if self.motion_weight: #only scoring looks at the machine state
+            self.move_machine(peg_index)
+        self.previous_pegs = self.previous_pegs[1:] + [peg_index]
+        self.current_index = peg_index
+        return record
+
+    def undo_line(self, record):
+        """Takes back a line applied by try_line"""
+        from_peg, peg_index, footprint, values, previous_pegs, machine, comparison = record
+        drawn, drawn_values, self.squared_error_sum = comparison
+        self.np_comparison[drawn] = drawn_values
+        if self.pyramid_size is not None:
+            old_values = self.np_image[footprint]
+            self.np_image[footprint] = values
+            self.update_coarse_image(footprint, old_values)
+        else:
+            self.np_image[footprint] = values
+        self.histogram[from_peg, peg_index] -= 1
+        self.histogram[peg_index, from_peg] -= 1
+        self.previous_pegs = previous_pegs
+        self.motion_time, self.machine_location, self.machine_direction = machine
+        self.current_index = from_peg
+
+    def sync_image(self):
+        """Brings the PIL image up to date with np_image. Only needed before previewing the image."""
+        if not self.image_synced:
+            self.image = Image.fromarray(np.clip(self.np_image, 0, 255).astype(np.uint8), 'L')
+            self.image_synced = True
+        return self.image
+
     def draw_line(self, peg_index):
         """Draws line across the image, erasing value along the line."""
-        draw = ImageDraw.Draw(self.image)
-        draw.line([self.pegs[self.current_index], self.pegs[peg_index]], fill=0, width = self.string_thickness)
+        #one footprint for both the residual and the comparison image
+        footprint = self.line_footprint(self.current_index, peg_index)
+        if self.engine != "pil":
+            self.erase_line(self.current_index, peg_index, footprint)
+        else:
+            draw = ImageDraw.Draw(self.image)
+            draw.line([self.pegs[self.current_index], self.pegs[peg_index]], fill=0, width = self.string_thickness)
 
-        self.draw_line_on_comparison(peg_index)
+        self.draw_line_on_comparison(peg_index, footprint)
 
         self.add_to_histogram(self.current_index, peg_index)
 
-        self.total_string_cost += self.string_cost_dict[frozenset([self.current_index, peg_index])]
+        self.total_string_cost += self.string_costs[self.pair_index(self.current_index, peg_index)]
+        self.move_machine(peg_index)
 
         self.current_index = peg_index
         self.previous_pegs.append(peg_index)
         self.previous_pegs.pop(0)
-        self.np_image = np.asarray(self.image.getdata(),dtype=np.float64).reshape((self.image.size[1], self.image.size[0]))
+        if self.engine == "pil":
+            self.np_image = np.asarray(self.image, dtype=np.float64)
+
+
+    def choose_next_peg(self):
+        """Asks the solver for the next peg, with the same stopping rule as compute_best_path."""
+        if self.solver is None:
+            return self.compute_best_path()
+        return self.solver.next_peg(self)
 
+    def find_peg_list(self, max_string = None):
+        """Create a peg list
 
-    def find_peg_list(self):
-        """Create a peg list"""
+        max_string -- optional spool length, stops once total_string_cost reaches it
+        """
         line_num = 0
-        peg_list = [0]
+        peg_list = [self.current_index]
         while line_num < self.max_lines:
+            if max_string is not None and self.total_string_cost >= max_string:
+                break
             line_num +=1
-            best_peg = self.compute_best_path()
+            best_peg = self.choose_next_peg()
 
             if best_peg == peg_list[-1]:
                 break
@@ -339,58 +1076,38 @@ class ImageProcessor:
 
     def find_next_peg(self):
         """Function to run in live loop. Calculates the next peg to be drawn by the System object."""
-        best_peg = self.compute_best_path()
+        best_peg = self.choose_next_peg()
         if best_peg != self.current_index:
             self.draw_line(best_peg)
         return best_peg
 
     def add_to_histogram(self, peg_1, peg_2):
-        self.histogram[frozenset([peg_1, peg_2])] = self.histogram.get(frozenset([peg_1, peg_2]), 0) + 1
-
+        self.histogram[peg_1, peg_2] += 1
+        self.histogram[peg_2, peg_1] = self.histogram[peg_1, peg_2]
 
-    def mean_squared_error(self, size = (400, 400)):
-        """Calculate the mean squared error of two images.
-        The mean squared value is the difference of all pixels (comparing the two images) added up und divided by the total amount of pixelsself.
 
-        imageA -- PIL image object (should be square)
-        imageB -- PIL image object (should be square)"""
+    def mean_squared_error(self):
+        """Records the mean squared error between the original image and the lines drawn so far in M2Error_list.
+        The error is kept up to date by draw_line_on_comparison, so this is exact at every step and costs nothing."""
 
-        size = size
         self.plot_steps += 1
+        err = self.image_error()
+        self.M2Error_list.append([self.total_string_cost, err]) #saves error data in list with number of string
 
         if self.plot_steps % 10 == 0:
-
-            imageA = self.original
-            imageB = self.comparison_image
-
-            #prepare the two pictures to compare:
-            #monochrome, same size
-            imageA = imageA.convert('L')      ###
-            imageB = imageB.convert('L')      ###
-            #same size
-            imageA.thumbnail(size, Image.ANTIALIAS)
-            imageB.thumbnail(size, Image.ANTIALIAS)
-
-
-            #Convert PIL.image object into a numpy.array - needs to be numpy the "astype" attribute
-            a = np.array(imageA)
-            b = np.array(imageB)
-            # the 'Mean Squared Error' between the two images is the
-        	# sum of the squared difference between the two images;
-        	# NOTE: the two images must have the same dimension
-            err = np.sum((a.astype("float")-b.astype("float"))**2)
-            err /= float(a.shape[0] * b.shape[1])
-            # return the MSE, the lower the error, the more "similar"
-            ###print(err)
-        	# the two images are
-
-            self.M2Error_list.append([self.total_string_cost, err]) #saves error data in list with number of string
             print("M2Error = ", err)
+        return err
+
+    def image_error(self):
+        """Returns the mean squared error between the original image and the lines drawn so far, at full resolution."""
+        return self.squared_error_sum/self.np_comparison.size
 
     def plot_mean_squared_error(self):
         """Shows the bokeh error plot"""
         xs = [i[0] for i in self.M2Error_list]
         ys = [i[1] for i in self.M2Error_list]
+        self.error_plot = figure( title="Image Error")
+        self.error_plot.xaxis.axis_label = 'String Used'
         self.error_plot.line(xs, ys, color='#A6CEE3', legend='Error')
         show(self.error_plot)
 
@@ -412,11 +1129,12 @@ if __name__ == "__main__":
     max_overlap = 2
 
     window_size = [1200, 800]
+    frame_rate = 30
 
-    stringomatic = System(window_size, peg_num = peg_num, string_thickness = string_thickness)
+    stringomatic = System(window_size, peg_num = peg_num, string_thickness = string_thickness, dirty_rects = True)
     done = False
     image = ImageProcessor(file_name, peg_num = peg_num, string_thickness = string_thickness,
-                            real_radius = real_radius, max_overlap = max_overlap)
+                            real_radius = real_radius, max_overlap = max_overlap, engine = "numpy")
 
     stringomatic.add_image_information(image)
 
@@ -424,6 +1142,12 @@ if __name__ == "__main__":
     # print(peg_list)
     # stringomatic.draw_mesh(peg_list)
 
+    #solve in the background and draw whatever was solved once per frame
+    peg_queue = queue.Queue()
+    solver = SolverThread(image, peg_queue, max_string = max_string)
+    solver.start()
+    clock = pygame.time.Clock()
+
     check = True #checks if string art is complete
     while not done:
         for event in pygame.event.get():
@@ -436,6 +1160,10 @@ if __name__ == "__main__":
                     done = True
                 elif event.key == pygame.K_SPACE:
                     check = not check
+                    if check:
+                        solver.resume()
+                    else:
+                        solver.pause()
                     # if not check:
                     #     image.comparison_image.show()
                     #     image.plot_mean_squared_error()
@@ -443,7 +1171,7 @@ if __name__ == "__main__":
             if event.type == pygame.MOUSEBUTTONDOWN:
                 stringomatic.process_click()
 
-        if image.total_string_cost < max_string and check:
-            check = stringomatic.draw_mesh_live(image)
-        else:
-            sleep(.1)
+        stringomatic.draw_queued_lines(peg_queue)
+        clock.tick(frame_rate)
+
+    solver.stop()
@@ -0,0 +1,138 @@
+# solvers holds the strategies ImageProcessor can use to pick the next peg.
+# A solver is any object with a next_peg(ImageProcessor) method, passed in
+# with ImageProcessor(..., solver = ...).
+#
+# Compare solvers on an image from the Image Processing folder:
+#   python -m src.solvers pokeball.jpeg --pegs 90 --max-string 1000 --beam-width 4 --depth 3
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from src.simulation import ImageProcessor
+
+
+class GreedySolver:
+    """Picks the line with the highest fit from the current peg, same as ImageProcessor without a solver."""
+
+    def next_peg(self, image):
+        return image.compute_best_path()
+
+
+class BeamSearchSolver:
+    """
+    Looks depth lines ahead and keeps the beam_width best partial sequences at every level,
+    then draws the first line of the best sequence. Only the branch best scoring lines of each
+    sequence are expanded, which prunes the search before any line is tried out.
+    Sequences are ranked by the image error left after them (see ImageProcessor.image_error), the measure
+    the result is judged by, since summed line fits don't track it: they ignore lines darkening a pixel twice.
+    """
+
+    def __init__(self, beam_width = 4, depth = 2, branch = None):
+        self.beam_width = beam_width
+        self.depth = depth
+        self.branch = branch if branch is not None else beam_width
+
+    def best_candidates(self, image):
+        """Returns the branch best scoring pegs from the current peg with their positive scores"""
+        scores = image.candidate_scores()
+        count = min(self.branch, len(scores))
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[scores[top] > 0]
+        return top, scores[top]
+
+    def next_peg(self, image):
+        beams = [(image.squared_error_sum, [])] #(squared error after the sequence, pegs after the current peg)
+
+        for level in range(self.depth):
+            expansions = []
+            for error, path in beams:
+                #replay the sequence on the solver state, try out its best lines, then take it back
+                records = [image.try_line(peg) for peg in path]
+                pegs, scores = self.best_candidates(image)
+                for peg in pegs:
+                    record = image.try_line(int(peg))
+                    expansions.append((image.squared_error_sum, path + [int(peg)]))
+                    image.undo_line(record)
+                for record in reversed(records):
+                    image.undo_line(record)
+
+                if len(pegs) == 0 and level > 0:
+                    expansions.append((error, path)) #nothing left to draw after this sequence
+
+            if not expansions:
+                break
+            expansions.sort(key = lambda beam: beam[0])
+            beams = expansions[:self.beam_width]
+
+        if not beams[0][1]:
+            return image.compute_best_path()
+        return beams[0][1][0]
+
+
+def run_solver(image, solver, max_string = None, max_lines = None):
+    """Runs a solver from a fresh start on an ImageProcessor and returns its error, string used, lines and time."""
+    image.reset(max_lines = max_lines)
+    image.solver = solver
+    start = time.time()
+    peg_list = image.find_peg_list(max_string)
+    return dict(
+        solve_time = time.time() - start,
+        mse = image.image_error(),
+        string_used = image.total_string_cost,
+        lines = len(peg_list) - 1,
+        )
+
+
+def compare_solvers(image, solvers, max_string = None, max_lines = None):
+    """
+    Runs every solver in the solvers dictionary on the same ImageProcessor and reports each one
+    against the "greedy" baseline: error removed from the blank board per foot of string, and
+    error improvement over greedy per extra second of compute.
+    """
+    solvers = dict({"greedy": GreedySolver()}, **solvers)
+    image.reset()
+    blank_error = image.image_error()
+
+    results = {name: run_solver(image, solver, max_string, max_lines) for name, solver in solvers.items()}
+    greedy = results["greedy"]
+    for result in results.values():
+        result["error_removed_per_foot"] = (blank_error - result["mse"])/max(result["string_used"], 1e-9)
+        result["gain_over_greedy"] = greedy["mse"] - result["mse"]
+        extra_time = result["solve_time"] - greedy["solve_time"]
+        result["gain_per_extra_second"] = result["gain_over_greedy"]/extra_time if extra_time > 0 else 0
+    return results
+
+
+def parse_args(args = None):
+    parser = argparse.ArgumentParser(description = "Compare beam search against the greedy solver.")
+    parser.add_argument("file_name", help = "image to process")
+    parser.add_argument("--pegs", type = int, default = 36, help = "number of pegs")
+    parser.add_argument("--max-string", type = float, default = None, help = "spool length in feet")
+    parser.add_argument("--max-lines", type = int, default = 1000, help = "maximum number of lines")
+    parser.add_argument("--max-overlap", type = int, default = 5, help = "times a line can be drawn")
+    parser.add_argument("--beam-width", type = int, nargs = "+", default = [4], help = "beam widths to try")
+    parser.add_argument("--depth", type = int, nargs = "+", default = [2], help = "lookahead depths to try")
+    parser.add_argument("--line-model", choices = ["legacy", "antialiased"], default = "legacy", help = "line model, see ImageProcessor")
+    parser.add_argument("-o", "--output", help = "JSON file to save the results to")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    image = ImageProcessor(os.path.abspath(args.file_name), peg_num = args.pegs, max_lines = args.max_lines,
+                            max_overlap = args.max_overlap, engine = "numpy", show_original = False, line_model = args.line_model)
+    solvers = {"beam_{}x{}".format(width, depth): BeamSearchSolver(width, depth)
+                for width in args.beam_width for depth in args.depth}
+    results = compare_solvers(image, solvers, args.max_string, args.max_lines)
+
+    print("solver        time (s)       mse  string_used  gain_over_greedy  gain_per_extra_second")
+    for name, result in results.items():
+        print("{:12}  {solve_time:8.2f}  {mse:8.1f}  {string_used:11.1f}  {gain_over_greedy:16.1f}  {gain_per_extra_second:21.2f}".format(name, **result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 4)
@@ -0,0 +1,88 @@
+# sweep runs a grid of solver settings against one image and reports the final
+# error against the string used for every setting, so settings can be picked
+# without rerunning main.py by hand.
+#
+# The image is only preprocessed once and the line geometry is only computed
+# once per peg_num. Different max_string values reuse the same run, since a
+# shorter spool just stops the same greedy path earlier.
+#
+# Run from the Image Processing folder:
+#   python -m src.sweep pokeball.jpeg --pegs 48 90 --overlap 2 5 --thickness 1 2 --max-string 500 1000 2000
+
+import argparse
+import json
+import os
+import time
+from itertools import product
+
+from src.simulation import ImageProcessor
+from src.cache import ImageCache
+
+
+def sweep(file_name, peg_nums = (36,), max_overlaps = (5,), string_thicknesses = (1,), max_strings = (None,),
+          max_lines = 1000, real_radius = .75, engine = "numpy", cache_dir = None):
+    """
+    Runs every combination of the given settings and returns a list of result dictionaries
+    with the settings, string_used, lines, mse and solve_time of each point.
+
+    cache_dir -- optional folder to cache preprocessed images and line indexes in between sweeps
+    """
+    results = []
+    max_strings = sorted(max_strings, key = lambda max_string: float("inf") if max_string is None else max_string)
+    cache = ImageCache(cache_dir) if cache_dir is not None else None
+    image = ImageProcessor(file_name, peg_num = peg_nums[0], max_lines = max_lines, real_radius = real_radius,
+                            engine = engine, show_original = False, cache = cache)
+
+    for peg_num in peg_nums:
+        if peg_num != image.peg_num:
+            image.set_peg_num(peg_num)
+
+        for max_overlap, string_thickness in product(max_overlaps, string_thicknesses):
+            image.reset(string_thickness = string_thickness, max_overlap = max_overlap, max_lines = max_lines)
+            start = time.time()
+            lines = 0
+
+            #continue the same run up to each spool length
+            for max_string in max_strings:
+                image.max_lines = max_lines - lines
+                lines += len(image.find_peg_list(max_string)) - 1
+                results.append(dict(
+                    peg_num = peg_num,
+                    max_overlap = max_overlap,
+                    string_thickness = string_thickness,
+                    max_string = max_string,
+                    string_used = image.total_string_cost,
+                    lines = lines,
+                    mse = image.image_error(),
+                    solve_time = time.time() - start,
+                    ))
+    return results
+
+
+def parse_args(args = None):
+    parser = argparse.ArgumentParser(description = "Compare string art solver settings on one image.")
+    parser.add_argument("file_name", help = "image to process")
+    parser.add_argument("--pegs", type = int, nargs = "+", default = [36], help = "peg numbers")
+    parser.add_argument("--overlap", type = int, nargs = "+", default = [5], help = "max overlaps")
+    parser.add_argument("--thickness", type = int, nargs = "+", default = [1], help = "string thicknesses in pixels")
+    parser.add_argument("--max-string", type = float, nargs = "+", default = [None], help = "spool lengths in feet")
+    parser.add_argument("--max-lines", type = int, default = 1000, help = "maximum number of lines")
+    parser.add_argument("--radius", type = float, default = .75, help = "board radius in feet")
+    parser.add_argument("--cache-dir", default = None, help = "folder to cache preprocessed images and lines in")
+    parser.add_argument("-o", "--output", help = "JSON file to save the results to")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = sweep(os.path.abspath(args.file_name), peg_nums = args.pegs, max_overlaps = args.overlap,
+                    string_thicknesses = args.thickness, max_strings = args.max_string,
+                    max_lines = args.max_lines, real_radius = args.radius, cache_dir = args.cache_dir)
+
+    print("pegs  overlap  thickness  max_string  string_used  lines       mse")
+    for result in results:
+        print("{peg_num:4}  {max_overlap:7}  {string_thickness:9}  {max_string!s:>10}  {string_used:11.1f}  {lines:5}  {mse:8.1f}".format(**result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 4)
@@ -0,0 +1,153 @@
+# transport talks to the Arduino over pyserial with asyncio instead of
+# flush/write/sleep(1)/readline loops. A message counts as done when the
+# Arduino replies with its ack line ("Tasks Completed!" in Stepper_Control.ino),
+# so the next message goes out as soon as the machine is ready instead of on
+# the next one second poll. Up to window messages can be in flight at once.
+#
+# Every message is sent as "#<seq>:<message>" and the sketch echoes the
+# sequence id in its ack ("Tasks Completed! #<seq>"), so acks are matched by
+# id. A message whose ack is late or lost is sent again with the same id, and
+# the sketch acks an id it already carried out without moving again.
+# Acks for ids nothing is waiting on (late ones) are thrown away. start() asks
+# the machine for the last id it carried out ("?SEQ") and counts on from there.
+#
+# Messages are ended with a newline so the sketch can tell them apart when
+# several are waiting in its buffer. Keep window * message size under the
+# Arduino's 64 byte serial buffer. Binary frames from src/framing.py carry no
+# sequence id, send them with framing.send_frame_and_receive_response.
+#
+# Example:
+#   from src.compute_directions import command_message
+#
+#   async def run(serial_port, commands):
+#       transport = AsyncSerialTransport(serial_port, window = 2)
+#       await transport.start()
+#       await transport.send_many(command_message(command) for command in commands)
+#       await transport.close()
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+ACK = "Tasks Completed!"
+SEQUENCE_QUERY = "?SEQ"
+
+
+def peg_list_message(peg_list):
+    """Formats a list of (peg_num, move_type) tuples as "peg,peg,...;move,move,..." like serial_communication.py"""
+    return ",".join(str(peg) for peg, move_type in peg_list) + ";" + ",".join(str(move_type) for peg, move_type in peg_list)
+
+
+class AsyncSerialTransport:
+    """
+    Sends messages to a pyserial port and matches the Arduino's ack replies to them in order.
+
+    serial_port -- open serial.Serial (or anything with write and readline), use a short read timeout like .1s
+    window -- how many messages can wait for an ack at once
+    timeout -- seconds to wait for the ack of a message before sending it again
+    retries -- how many times a message is sent again before giving up with a TimeoutError
+    """
+
+    def __init__(self, serial_port, ack = ACK, window = 1, timeout = 30, retries = 2, terminator = "\n"):
+        self.serial_port = serial_port
+        self.ack = ack
+        self.window = window
+        self.timeout = timeout
+        self.retries = retries
+        self.terminator = terminator
+        self.next_seq = 0
+        self.pending = {} #seq: future waiting for its ack
+        self.messages = [] #lines from the Arduino that weren't acks
+        self.stale_acks = [] #acks nothing was waiting on, late ones for messages that were sent again
+        self.reader = None #task reading replies, set by start()
+        self.slots = None #semaphore of the window, set by start()
+        #one thread each so writes go out in the order they were queued
+        self.write_thread = ThreadPoolExecutor(max_workers = 1)
+        self.read_thread = ThreadPoolExecutor(max_workers = 1)
+
+    async def start(self, attempts = 3):
+        """Asks the machine for the last sequence id it carried out and starts reading replies in the background"""
+        self.slots = asyncio.Semaphore(self.window)
+        last_seq = await self.query_sequence(attempts)
+        self.next_seq = last_seq + 1 if last_seq is not None else 0
+        self.reader = asyncio.ensure_future(self.read_replies())
+
+    async def query_sequence(self, attempts = 3):
+        """Returns the machine's answer to "?SEQ", or None if it doesn't answer. Other lines are skipped."""
+        loop = asyncio.get_running_loop()
+        for attempt in range(attempts):
+            await self.write(SEQUENCE_QUERY)
+            while True:
+                line = await loop.run_in_executor(self.read_thread, self.serial_port.readline)
+                if not line:
+                    break #read timed out, ask again
+                line = line.decode(errors = "replace").strip()
+                if line.startswith("SEQ "):
+                    return int(line.split()[1])
+        return None
+
+    async def close(self):
+        """Stops reading replies, messages still waiting for an ack fail.
+        Safe to call when start() never ran or failed, like from a finally after a failed connect."""
+        if self.reader is not None:
+            self.reader.cancel()
+            try:
+                await self.reader
+            except asyncio.CancelledError:
+                pass
+            self.reader = None
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("transport closed"))
+        self.pending.clear()
+        self.write_thread.shutdown()
+        self.read_thread.shutdown()
+
+    async def write(self, message):
+        data = (message + self.terminator).encode()
+        await asyncio.get_running_loop().run_in_executor(self.write_thread, self.serial_port.write, data)
+
+    async def read_replies(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            line = await loop.run_in_executor(self.read_thread, self.serial_port.readline)
+            if not line:
+                continue #read timed out
+            line = line.decode(errors = "replace").strip()
+            if not line.startswith(self.ack):
+                self.messages.append(line)
+                continue
+            seq = line[len(self.ack):].strip().lstrip("#")
+            future = self.pending.get(int(seq)) if seq.isdigit() else None
+            if future is not None and not future.done():
+                future.set_result(line)
+            else:
+                self.stale_acks.append(line)
+
+    async def send(self, message):
+        """Sends a message and waits for its ack. Returns the ack line."""
+        if isinstance(message, bytes):
+            raise TypeError("binary frames carry no sequence id, send them with framing.send_frame_and_receive_response")
+        seq = self.next_seq
+        self.next_seq += 1
+        async with self.slots:
+            future = asyncio.get_running_loop().create_future()
+            self.pending[seq] = future
+            try:
+                for attempt in range(self.retries + 1):
+                    #same id every time, so the machine acks a message it already carried out without moving again
+                    await self.write("#{}:{}".format(seq, message))
+                    try:
+                        return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+                    except asyncio.TimeoutError:
+                        continue
+                raise TimeoutError("no ack for {!r} after {} tries".format(message, self.retries + 1))
+            finally:
+                del self.pending[seq]
+
+    async def send_many(self, messages):
+        """Sends messages in order, keeping up to window of them in flight. Returns their ack lines."""
+        tasks = []
+        for message in messages:
+            tasks.append(asyncio.ensure_future(self.send(message)))
+            await asyncio.sleep(0) #let the task take its slot so messages go out in order
+        return await asyncio.gather(*tasks)
@@ -0,0 +1,53 @@
+# Run from the Image Processing folder: python -m pytest tests
+
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from src.benchmark import make_test_image
+from src.checkpoint import Checkpointer, load_checkpoint, save_checkpoint
+from src.simulation import ImageProcessor
+
+
+@pytest.fixture(scope = "module")
+def test_image():
+    return make_test_image(200)
+
+
+@pytest.mark.parametrize("engine", ["pil", "numpy", "lowmem"])
+def test_resumed_run_finishes_like_an_uninterrupted_one(test_image, tmp_path, engine):
+    settings = dict(peg_num = 36, engine = engine, motion_weight = .2)
+    uninterrupted = ImageProcessor(test_image, max_lines = 100, **settings).find_peg_list()
+
+    image = ImageProcessor(test_image, max_lines = 40, **settings)
+    peg_list = image.find_peg_list()
+    file_name = str(tmp_path/"checkpoint.npz")
+    save_checkpoint(file_name, image, peg_list, current_location = [1.5, 2], acknowledged = 30)
+
+    resumed = ImageProcessor(test_image, max_lines = 60, **settings)
+    saved_pegs, current_location, acknowledged = load_checkpoint(file_name, resumed)
+    assert (saved_pegs, current_location, acknowledged) == (peg_list, [1.5, 2], 30)
+    assert saved_pegs + resumed.find_peg_list()[1:] == uninterrupted
+
+
+@pytest.mark.parametrize("setting", [dict(max_overlap = 4), dict(real_radius = .5), dict(string_thickness = 2)])
+def test_checkpoint_of_other_settings_is_refused(test_image, tmp_path, setting):
+    image = ImageProcessor(test_image, peg_num = 36, max_lines = 10, engine = "numpy")
+    file_name = str(tmp_path/"checkpoint.npz")
+    save_checkpoint(file_name, image, image.find_peg_list())
+    with pytest.raises(ValueError, match = next(iter(setting))):
+        load_checkpoint(file_name, ImageProcessor(test_image, peg_num = 36, engine = "numpy", **setting))
+
+
+@pytest.mark.parametrize("stopped", [False, True])
+def test_checkpoint_is_removed_when_the_job_is_done(test_image, tmp_path, stopped):
+    image = ImageProcessor(test_image, peg_num = 36, max_lines = 10, engine = "numpy")
+    solver = SimpleNamespace(image = image, peg_list = image.find_peg_list(), lock = threading.Lock(), stopped = stopped)
+    streamer = SimpleNamespace(current_location = [0, 0], acknowledged = 10)
+    checkpointer = Checkpointer(str(tmp_path/"checkpoint.npz"), solver, every = 5)
+    checkpointer.acknowledged(streamer)
+    assert os.path.exists(checkpointer.file_name)
+    checkpointer.finish(streamer)
+    assert os.path.exists(checkpointer.file_name) == stopped
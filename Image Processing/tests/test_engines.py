@@ -0,0 +1,45 @@
+# Run from the Image Processing folder: python -m pytest tests
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from src.benchmark import make_test_image
+from src.simulation import ImageProcessor
+
+
+@pytest.fixture(scope = "module")
+def test_image():
+    return make_test_image(200)
+
+
+@pytest.mark.parametrize("string_thickness", [1, 3])
+def test_engines_give_the_same_pegs(test_image, string_thickness):
+    peg_lists = {engine: ImageProcessor(test_image, peg_num = 36, max_lines = 150, engine = engine,
+                                        string_thickness = string_thickness).find_peg_list()
+                 for engine in ["pil", "numpy", "lowmem"]}
+    assert peg_lists["numpy"] == peg_lists["pil"]
+    assert peg_lists["lowmem"] == peg_lists["pil"]
+
+
+@pytest.mark.parametrize("string_thickness", [1, 2, 3, 5])
+def test_footprint_is_what_pil_draws(test_image, string_thickness):
+    image = ImageProcessor(test_image, peg_num = 36, engine = "numpy", string_thickness = string_thickness)
+    for peg_1, peg_2 in [(0, 1), (0, 9), (0, 18), (3, 22), (7, 30), (12, 13)]:
+        canvas = Image.new('L', image.image.size, 0)
+        ImageDraw.Draw(canvas).line([image.pegs[peg_1], image.pegs[peg_2]], fill = 255, width = string_thickness)
+        drawn = np.zeros(image.np_image.shape, dtype = bool)
+        drawn[image.line_footprint(peg_1, peg_2)] = True
+        assert (drawn == (np.asarray(canvas) > 0)).all()
+
+
+@pytest.mark.parametrize("settings", [dict(engine = "pil"), dict(engine = "numpy", string_thickness = 3),
+                                      dict(engine = "lowmem"), dict(engine = "numpy", line_model = "antialiased"),
+                                      dict(engine = "numpy", pyramid_size = 100)])
+def test_tracked_error_is_the_mean_squared_error(test_image, settings):
+    image = ImageProcessor(test_image, peg_num = 36, **settings)
+    for step in range(80):
+        image.draw_line(image.compute_best_path())
+        if step % 20 == 19:
+            error = ((image.np_original.astype(np.float64) - image.np_comparison)**2).mean()
+            assert image.image_error() == pytest.approx(error)
@@ -0,0 +1,43 @@
+# Run from the Image Processing folder: python -m pytest tests
+
+import pytest
+
+from src.framing import ACK, BAD_FRAME, negotiate_batch_size, send_frame_and_receive_response
+
+
+class ScriptedPort:
+    """Serial port that answers each write with the next lines of replies, None for a read that times out"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.lines = []
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+        if self.replies:
+            self.lines += self.replies.pop(0)
+
+    def readline(self):
+        line = self.lines.pop(0) if self.lines else None
+        return (line + "\r\n").encode() if line is not None else b""
+
+
+def test_late_buffer_answers_are_not_taken_for_acks():
+    #the first query is answered after the read timed out, with both answers arriving later
+    port = ScriptedPort([[None], ["BUF 200", "BUF 200"], [ACK]])
+    assert negotiate_batch_size(port) == 200
+    assert send_frame_and_receive_response([(1, 0), (2, 1)], port) == ACK
+
+
+def test_frame_waits_for_its_ack():
+    port = ScriptedPort([["BUF 200", BAD_FRAME], ["BUF 200", ACK]])
+    assert send_frame_and_receive_response([(1, 0)], port) == ACK
+    assert len(port.written) == 2
+
+
+def test_silent_machine_times_out():
+    port = ScriptedPort([["BUF 200"]])
+    with pytest.raises(TimeoutError):
+        send_frame_and_receive_response([(1, 0), (2, 1)], port, timeout = .05)
+    assert len(port.written) == 1
@@ -0,0 +1,24 @@
+# Run from the Image Processing folder: python -m pytest tests
+
+import numpy as np
+import pytest
+
+from src.compute_directions import compile_peg_list
+from src.motion import advance, final_turn_time, program_time
+
+
+@pytest.mark.parametrize("peg_num", [48, 90, 96])
+def test_step_times_add_up_to_program_time(peg_num):
+    rng = np.random.default_rng(peg_num)
+    peg_list = [0]
+    for peg in rng.integers(0, peg_num, 300):
+        if peg != peg_list[-1]:
+            peg_list.append(int(peg))
+    current_location, program = compile_peg_list(peg_num, peg_list, 1)
+
+    total, location, direction = 0, (0, 0), None
+    for peg, next_peg in zip(peg_list, peg_list[1:]):
+        seconds, location, direction = advance(peg_num, 1, location, peg, direction, next_peg)
+        total += seconds
+    total += final_turn_time(peg_num, 1, location, peg_list[-1], direction)
+    assert total == pytest.approx(program_time(program, peg_num, 1))
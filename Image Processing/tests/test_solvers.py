@@ -0,0 +1,28 @@
+# Run from the Image Processing folder: python -m pytest tests
+
+import pytest
+
+from src.benchmark import make_test_image
+from src.simulation import ImageProcessor
+from src.solvers import BeamSearchSolver, compare_solvers
+
+
+@pytest.fixture(scope = "module")
+def test_image():
+    return make_test_image(200)
+
+
+@pytest.mark.parametrize("line_model", ["legacy", "antialiased"])
+def test_beam_search_beats_greedy(test_image, line_model):
+    image = ImageProcessor(test_image, peg_num = 36, max_lines = 100, engine = "numpy", line_model = line_model)
+    results = compare_solvers(image, {"beam": BeamSearchSolver(4, 2)}, max_lines = 100)
+    assert results["beam"]["mse"] <= results["greedy"]["mse"]
+
+
+def test_lookahead_is_taken_back(test_image):
+    image = ImageProcessor(test_image, peg_num = 36, max_lines = 20, engine = "numpy")
+    image.find_peg_list()
+    before = (image.np_image.copy(), image.np_comparison.copy(), image.squared_error_sum, image.current_index)
+    BeamSearchSolver(4, 3).next_peg(image)
+    assert (image.np_image == before[0]).all() and (image.np_comparison == before[1]).all()
+    assert (image.squared_error_sum, image.current_index) == before[2:]
@@ -0,0 +1,82 @@
+# Runs AsyncSerialTransport against FakeArduino on a pseudo terminal.
+# Run from the Image Processing folder: python -m pytest tests
+
+import asyncio
+
+import pytest
+import serial
+
+from src.fake_arduino import FakeArduino
+from src.transport import AsyncSerialTransport
+
+MESSAGES = ["{},{};0,1".format(peg, peg + 1) for peg in range(10)]
+
+
+@pytest.fixture
+def fake_arduino(request):
+    fake = FakeArduino(**getattr(request, "param", {}))
+    fake.start()
+    yield fake
+    fake.stop()
+
+
+def send_all(fake, messages, **settings):
+    """Sends messages through a new transport, returns their acks and the transport"""
+    async def run():
+        serial_port = serial.Serial(fake.port_name, 9600, timeout = .05)
+        transport = AsyncSerialTransport(serial_port, **settings)
+        await transport.start()
+        try:
+            return await transport.send_many(messages), transport
+        finally:
+            await transport.close()
+            serial_port.close()
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("fake_arduino", [dict(move_time = .15)], indirect = True)
+@pytest.mark.parametrize("window", [1, 2])
+def test_late_acks_do_not_repeat_moves(fake_arduino, window):
+    acks, transport = send_all(fake_arduino, MESSAGES, window = window, timeout = .1, retries = 5)
+    assert fake_arduino.received == MESSAGES
+    assert fake_arduino.repeated #the transport did send messages again
+    assert acks == ["Tasks Completed! #{}".format(seq) for seq in range(len(MESSAGES))]
+
+
+@pytest.mark.parametrize("fake_arduino", [dict(drop_every = 4)], indirect = True)
+def test_lost_acks_do_not_repeat_moves(fake_arduino):
+    acks, transport = send_all(fake_arduino, MESSAGES, timeout = .2)
+    assert fake_arduino.received == MESSAGES
+    assert fake_arduino.repeated == [3, 7]
+    assert len(acks) == len(MESSAGES)
+
+
+@pytest.mark.parametrize("fake_arduino", [dict(move_time = .5)], indirect = True)
+def test_no_ack_times_out(fake_arduino):
+    with pytest.raises(TimeoutError):
+        send_all(fake_arduino, MESSAGES[:1], timeout = .1, retries = 1)
+
+
+def test_new_transport_counts_on_from_the_machine(fake_arduino):
+    send_all(fake_arduino, MESSAGES[:3])
+    acks, transport = send_all(fake_arduino, MESSAGES[3:5])
+    assert acks == ["Tasks Completed! #3", "Tasks Completed! #4"]
+    assert fake_arduino.received == MESSAGES[:5]
+    assert not fake_arduino.repeated
+
+
+def test_frames_are_refused(fake_arduino):
+    with pytest.raises(TypeError):
+        send_all(fake_arduino, [b"\xa5\x00\x00"])
+
+
+def test_close_without_start(fake_arduino):
+    async def run():
+        serial_port = serial.Serial(fake_arduino.port_name, 9600, timeout = .05)
+        transport = AsyncSerialTransport(serial_port)
+        try:
+            await transport.close()
+            await transport.close()
+        finally:
+            serial_port.close()
+    asyncio.run(run())
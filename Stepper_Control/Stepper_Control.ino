@@ -34,8 +34,11 @@ int curr_peg_num = 0; // first peg always starts at 0
 String peg_list;
 String peg_nums;
 String move_types;
-int peg_nums_arr[200];
-int move_types_arr[200];
+const int MAX_BATCH = 200; // size of peg_nums_arr and move_types_arr, sent to python as the batch size
+int peg_nums_arr[MAX_BATCH];
+int move_types_arr[MAX_BATCH];
+const byte FRAME_START = 0xA5; // first byte of a binary peg frame (see src/framing.py)
+long last_seq = -1; // sequence id of the last "#<seq>:" message carried out (see src/transport.py)
 int first = 1; // used to move the dispenser to the edge before executing any commands
 
 // Create stack arrays for unwind function 
@@ -289,6 +292,46 @@ float moveRadius(float radius){
   return (radius*FEET_TO_MM/1.038);
 }
 
+// crc8 adds a byte to a CRC-8 checksum (polynomial 0x07), same as crc8() in src/framing.py
+byte crc8(byte crc, byte data){
+  crc ^= data;
+  for(int i = 0; i < 8; i++){
+    if(crc & 0x80){
+      crc = (crc << 1) ^ 0x07;
+    }
+    else{
+      crc = crc << 1;
+    }
+  }
+  return crc;
+}
+
+// readFrame reads a binary frame after its start byte into peg_nums_arr and move_types_arr
+// Frame: count byte, count pairs of bytes (peg_num << 1 | move_type, high byte first), checksum byte
+// Returns the number of pegs read, or -1 if the frame was cut short, too long or its checksum is wrong
+int readFrame(){
+  byte count;
+  if(Serial.readBytes(&count, 1) != 1 || count > MAX_BATCH){
+    return -1;
+  }
+  byte crc = crc8(0, count);
+  for(int i = 0; i < count; i++){
+    byte packed[2];
+    if(Serial.readBytes(packed, 2) != 2){
+      return -1;
+    }
+    crc = crc8(crc8(crc, packed[0]), packed[1]);
+    unsigned int value = ((unsigned int)packed[0] << 8) | packed[1];
+    peg_nums_arr[i] = value >> 1;
+    move_types_arr[i] = value & 1;
+  }
+  byte checksum;
+  if(Serial.readBytes(&checksum, 1) != 1 || checksum != crc){
+    return -1;
+  }
+  return count;
+}
+
 // setup initializes the stepper motors, limit switch, serial port, and runs the limit switch calibration
 void setup()
 {  
@@ -320,27 +363,84 @@ void setup()
     stepper_r.moveToHomeInMillimeters(-1, 20, 250, R_LIMIT_SWITCH_OUTPUT);
 }
 
-// loop receives the peg list message from python, converts it into two arrays of floats
+// loop receives the peg list message from python, either as a binary frame or as text, converts it into two arrays of floats
 // Calls move_to_peg for every peg number and move_type
 // Send return message when tasks completed and waits for reply 
 void loop()
 {
   // Do nothing if no message from python
   while(!Serial.available()) {} 
+  // Binary frame section
+  if(Serial.peek() == FRAME_START){
+    Serial.read();
+    int count = readFrame();
+    if(count < 0){
+      // Throw away the rest of the broken frame and ask python to send it again
+      delay(50);
+      while(Serial.available()){
+        Serial.read();
+      }
+      Serial.println("Bad Frame!");
+      return;
+    }
+    if(first == 1){ // for just first time, move to the starting position
+      toEdge();
+      first = 0;
+    }
+    for(int i=0; i< count; i++){
+      move_to_peg(peg_nums_arr[i], move_types_arr[i]);
+    }
+    Serial.println("Tasks Completed!");
+    return;
+  }
   // Serial read section
   while(Serial.available()){
     delay(30);
     int index = 0; // keeps track of how many peg_num and move_type pairs are in peg_list
+    long seq = -1; // sequence id of this message, -1 for messages without one
     if (Serial.available() > 0)
     {
-      // Read in python message
-      peg_list = Serial.readString();
+      // Read in python message, up to the newline that ends it (or the 1s timeout for messages without one)
+      peg_list = Serial.readStringUntil('\n');
       // If receive "Finished" message, then run unwind function 
       if(peg_list == "Finished"){
         delay(5000);
         unWind(motor_types,commands);
         exit(0);
       }
+      // If receive "?BUF" message, reply with how many pegs fit in one batch
+      if(peg_list == "?BUF"){
+        Serial.print("BUF ");
+        Serial.println(MAX_BATCH);
+        peg_list = "";
+        continue;
+      }
+      // If receive "?SEQ" message, reply with the sequence id of the last message carried out
+      if(peg_list == "?SEQ"){
+        Serial.print("SEQ ");
+        Serial.println(last_seq);
+        peg_list = "";
+        continue;
+      }
+      // Messages from the transport start with "#<seq>:", python sends one again when its ack is late or lost
+      if(peg_list.startsWith("#")){
+        int colonIndex = peg_list.indexOf(':');
+        seq = peg_list.substring(1, colonIndex).toInt();
+        peg_list = peg_list.substring(colonIndex+1);
+        if(seq <= last_seq){
+          // Already carried out, only send the ack again so the move isn't repeated
+          Serial.print("Tasks Completed! #");
+          Serial.println(seq);
+          peg_list = "";
+          continue;
+        }
+        if(seq > last_seq + 1 && last_seq >= 0){
+          // An earlier message got lost, skip this one until python sends them again in order
+          peg_list = "";
+          continue;
+        }
+        last_seq = seq;
+      }
       int semiColonIndex = peg_list.indexOf(';'); // find index that separates peg_nums from move_types
       // Get string of peg_nums and move_types
       peg_nums = peg_list.substring(0, semiColonIndex);
@@ -376,8 +476,14 @@ void loop()
       for(int i=0; i< index; i++){
         move_to_peg(peg_nums_arr[i], move_types_arr[i]);
       }
-      // Send reply message when tasks finished
-      Serial.println("Tasks Completed!");
+      // Send reply message when tasks finished, with the sequence id of the message if it had one
+      if(seq >= 0){
+        Serial.print("Tasks Completed! #");
+        Serial.println(seq);
+      }
+      else{
+        Serial.println("Tasks Completed!");
+      }
     }
     Serial.flush();
   }